@@ -6,11 +6,13 @@ Routes all /ask requests to the Mind agent safely, even under heavy load.
 """
 
 import asyncio
-import httpx
 import logging
 import os
 from typing import Any, Dict
 
+from utils.fair_queue import QueueRejected
+from utils.http_clients import http_clients
+
 # ---------------------------
 # Configuration
 # ---------------------------
@@ -22,8 +24,12 @@ NUM_WORKERS: int = int(os.getenv("BLOOD_NUM_WORKERS", 2))
 # URL for the Mind agent
 MIND_AGENT_URL: str = os.getenv("MIND_AGENT_URL", "http://mind:8000/generate")
 
-# Global asyncio queue
-queue: asyncio.Queue = asyncio.Queue()
+# Maximum queued prompts; further submissions are rejected instead of piling up
+QUEUE_MAX_SIZE: int = int(os.getenv("BLOOD_QUEUE_MAX_SIZE", 1000))
+
+# Global asyncio queue (bounded)
+queue: asyncio.Queue = asyncio.Queue(maxsize=QUEUE_MAX_SIZE)
+rejected: int = 0
 
 # ---------------------------
 # Worker function
@@ -39,33 +45,32 @@ async def worker(name: str) -> None:
       }
     """
     logging.info(f"🧠 Worker {name} started.")
-    async with httpx.AsyncClient(timeout=httpx.Timeout(30.0)) as client:
-        while True:
-            item: Dict[str, Any] = await queue.get()
-            prompt = item.get("prompt")
-            conversation_id = item.get("conversation_id", "default")
-            future: asyncio.Future = item.get("future")
-
-            try:
-                # Send prompt to the Mind agent
-                response = await client.post(
-                    MIND_AGENT_URL,
-                    json={"prompt": prompt, "conversation_id": conversation_id},
-                )
-                response.raise_for_status()
-                output = response.json().get("output", "No response received.")
-
-                # Set the result back to the waiting coroutine
-                if not future.done():
-                    future.set_result(output)
-
-                logging.info(f"[{name}] ✅ Processed prompt ({len(prompt)} chars)")
-            except Exception as e:
-                logging.error(f"[{name}] ❌ Error processing prompt: {e}")
-                if not future.done():
-                    future.set_exception(e)
-            finally:
-                queue.task_done()
+    while True:
+        item: Dict[str, Any] = await queue.get()
+        prompt = item.get("prompt")
+        conversation_id = item.get("conversation_id", "default")
+        future: asyncio.Future = item.get("future")
+
+        try:
+            # Send prompt to the Mind agent over the shared pooled client
+            response = await http_clients.get("mind").post(
+                MIND_AGENT_URL,
+                json={"prompt": prompt, "conversation_id": conversation_id},
+            )
+            response.raise_for_status()
+            output = response.json().get("output", "No response received.")
+
+            # Set the result back to the waiting coroutine
+            if not future.done():
+                future.set_result(output)
+
+            logging.info(f"[{name}] ✅ Processed prompt ({len(prompt)} chars)")
+        except Exception as e:
+            logging.error(f"[{name}] ❌ Error processing prompt: {e}")
+            if not future.done():
+                future.set_exception(e)
+        finally:
+            queue.task_done()
 
 # ---------------------------
 # Queue initialization
@@ -85,19 +90,25 @@ def start_workers(loop: asyncio.AbstractEventLoop = None) -> None:
 async def enqueue_prompt(prompt: str, conversation_id: str = "default") -> str:
     """
     Enqueue a prompt and asynchronously wait for the Mind agent's result.
+    Raises QueueRejected when the queue is full.
     """
+    global rejected
     if not prompt:
         raise ValueError("Prompt cannot be empty")
 
     loop = asyncio.get_event_loop()
     future: asyncio.Future = loop.create_future()
 
-    # Add the task to the queue
-    await queue.put({
-        "prompt": prompt,
-        "conversation_id": conversation_id,
-        "future": future,
-    })
+    # Add the task to the queue without waiting for space
+    try:
+        queue.put_nowait({
+            "prompt": prompt,
+            "conversation_id": conversation_id,
+            "future": future,
+        })
+    except asyncio.QueueFull:
+        rejected += 1
+        raise QueueRejected("full", retry_after=1)
 
     logging.info(f"🧾 Enqueued prompt for conversation '{conversation_id}'")
 
@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+"""
+Benchmark: cold start of the API.
+Measures, in fresh processes, how long `import main` takes and how long it takes
+from launching uvicorn until the first 200 from /health. Optional budgets make
+the script exit non-zero so a slow new import shows up as a failure.
+
+Usage:
+    python benchmarks/bench_cold_start.py --runs 5
+    python benchmarks/bench_cold_start.py --import-budget-ms 800 --health-budget-ms 2500
+"""
+
+import argparse
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+ENV = {
+    "SUPABASE_URL": "http://127.0.0.1:1",
+    "SUPABASE_KEY": "stub.stub.stub",
+    "GOOGLE_API_KEY": "bench",
+    "CUSTOM_SEARCH_ENGINE_ID": "bench",
+    "API_KEY": "bench",
+}
+
+# Children run in a scratch directory with the repo root appended: its asyncio.py cannot
+# shadow the stdlib, and the state files the app writes to its cwd (leader lock, results
+# store, click WAL, ...) land there instead of in the checkout
+IMPORT_SNIPPET = (
+    "import sys, time; sys.path.append(%r); started = time.perf_counter(); import main; "
+    "print((time.perf_counter() - started) * 1000); "
+    "print(','.join(m for m in ('pandas', 'pytrends', 'apscheduler', 'supabase') if m in sys.modules))"
+) % ROOT
+
+
+def child_env() -> dict:
+    env = dict(os.environ)
+    for key, value in ENV.items():
+        env.setdefault(key, value)
+    return env
+
+
+def measure_import() -> tuple:
+    with tempfile.TemporaryDirectory() as scratch:
+        out = subprocess.run(
+            [sys.executable, "-c", IMPORT_SNIPPET], cwd=scratch, env=child_env(),
+            capture_output=True, text=True, check=True,
+        ).stdout.split("\n")
+    return float(out[0]), out[1]
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def measure_first_health(timeout: float = 30.0) -> float:
+    with tempfile.TemporaryDirectory() as scratch:
+        return _first_health(scratch, timeout)
+
+
+def _first_health(cwd: str, timeout: float) -> float:
+    port = free_port()
+    started = time.perf_counter()
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--app-dir", ROOT, "--port", str(port), "--log-level", "warning"],
+        cwd=cwd, env=child_env(), stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    try:
+        while time.perf_counter() - started < timeout:
+            if proc.poll() is not None:
+                raise RuntimeError(f"uvicorn exited with code {proc.returncode}")
+            try:
+                with urllib.request.urlopen(f"http://127.0.0.1:{port}/health", timeout=1) as resp:
+                    if resp.status == 200:
+                        return (time.perf_counter() - started) * 1000
+            except OSError:
+                time.sleep(0.01)
+        raise RuntimeError("no /health response before timeout")
+    finally:
+        proc.terminate()
+        proc.wait(timeout=10)
+
+
+def report(label: str, samples: list) -> float:
+    median = statistics.median(samples)
+    print(f"{label:<24} median={median:8.1f} ms  min={min(samples):8.1f} ms  max={max(samples):8.1f} ms")
+    return median
+
+
+def main_() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--import-budget-ms", type=float, default=None)
+    parser.add_argument("--health-budget-ms", type=float, default=None)
+    args = parser.parse_args()
+
+    imports = [measure_import() for _ in range(args.runs)]
+    import_ms = report("import main", [ms for ms, _ in imports])
+    print(f"{'heavy modules loaded':<24} {imports[-1][1] or 'none'}")
+    health_ms = report("first /health (uvicorn)", [measure_first_health() for _ in range(args.runs)])
+
+    failed = False
+    if args.import_budget_ms is not None and import_ms > args.import_budget_ms:
+        print(f"❌ import budget exceeded: {import_ms:.1f} > {args.import_budget_ms:.1f} ms")
+        failed = True
+    if args.health_budget_ms is not None and health_ms > args.health_budget_ms:
+        print(f"❌ first /health budget exceeded: {health_ms:.1f} > {args.health_budget_ms:.1f} ms")
+        failed = True
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main_()
@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+"""
+Benchmark: GET /r/{link_id} redirects per second on a single worker.
+Drives the ASGI app in-process (no sockets) with a warm link cache, and
+separately times the UTM render path on its own.
+
+Usage:
+    python benchmarks/bench_redirects.py --requests 50000 --links 100
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+# Append (not prepend) the repo root so its top-level asyncio.py cannot shadow the stdlib
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+for key, value in {
+    "SUPABASE_URL": "http://127.0.0.1:1",
+    "SUPABASE_KEY": "stub.stub.stub",
+    "GOOGLE_API_KEY": "bench",
+    "CUSTOM_SEARCH_ENGINE_ID": "bench",
+    "API_KEY": "bench",
+}.items():
+    os.environ.setdefault(key, value)
+
+import main  # noqa: E402
+from utils.affiliate_links import link_cache  # noqa: E402
+from utils.click_pipeline import click_pipeline  # noqa: E402
+from utils.utm import build_utm_url  # noqa: E402
+
+
+def bench_render(requests: int, links: int) -> None:
+    urls = [f"https://shop.example.com/p/{i}?ref=blood" for i in range(links)]
+    started = time.perf_counter()
+    for i in range(requests):
+        build_utm_url(urls[i % links], "n8n", "affiliate", f"campaign-{i % 10}")
+    elapsed = time.perf_counter() - started
+    print(f"{'utm render (memoized)':<28} {requests / elapsed:12.0f} ops/sec")
+
+
+async def bench_asgi(requests: int, links: int) -> None:
+    sent = []
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        if message["type"] == "http.response.start":
+            sent.append(message["status"])
+
+    def scope(i: int):
+        return {
+            "type": "http",
+            "asgi": {"version": "3.0"},
+            "http_version": "1.1",
+            "method": "GET",
+            "scheme": "http",
+            "path": f"/r/link-{i % links}",
+            "raw_path": f"/r/link-{i % links}".encode(),
+            "query_string": f"source=n8n&campaign=campaign-{i % 10}".encode(),
+            "headers": [(b"host", b"bench")],
+            "client": ("127.0.0.1", 1234),
+            "server": ("bench", 80),
+        }
+
+    started = time.perf_counter()
+    for i in range(requests):
+        await main.app(scope(i), receive, send)
+        if i % 5000 == 0:
+            click_pipeline._buffer.clear()  # nothing flushes in this benchmark
+    elapsed = time.perf_counter() - started
+    assert all(status == 302 for status in sent), "unexpected non-302 response"
+    print(f"{'GET /r/{link_id} (ASGI)':<28} {requests / elapsed:12.0f} req/sec  "
+          f"({elapsed / requests * 1e6:.1f} µs/req)")
+
+
+def main_() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=50000)
+    parser.add_argument("--links", type=int, default=100)
+    args = parser.parse_args()
+
+    for i in range(args.links):
+        link_cache.put(f"link-{i}", f"https://shop.example.com/p/{i}?ref=blood")
+    click_pipeline.max_buffer = args.requests + 1
+
+    bench_render(args.requests, args.links)
+    asyncio.run(bench_asgi(args.requests, args.links))
+
+
+if __name__ == "__main__":
+    main_()
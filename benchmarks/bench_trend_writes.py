@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+"""
+Benchmark: per-cell Supabase inserts vs. chunked bulk upserts for fetch_trends.
+Runs against a local PostgREST stub so no real database is touched.
+
+Usage:
+    python benchmarks/bench_trend_writes.py --hours 168 --keywords 4 --latency-ms 5
+"""
+
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Append (not prepend) the repo root so its top-level asyncio.py cannot shadow the stdlib
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# utils.supabase_client reads these at import time (the client itself is created lazily)
+os.environ.setdefault("SUPABASE_URL", "http://127.0.0.1:1")
+os.environ.setdefault("SUPABASE_KEY", "stub.stub.stub")
+
+from supabase import create_client  # noqa: E402
+
+from trends.writer import TRENDS_TABLE, build_rows, upsert_rows  # noqa: E402
+
+# ---------------------------
+# PostgREST stub
+# ---------------------------
+class PostgrestStub(BaseHTTPRequestHandler):
+    """Accepts inserts/upserts on /rest/v1/<table> and counts received rows."""
+
+    latency: float = 0.0
+    rows_received: int = 0
+    requests: int = 0
+    lock = threading.Lock()
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        payload = json.loads(self.rfile.read(length) or b"[]")
+        rows = len(payload) if isinstance(payload, list) else 1
+        if self.latency:
+            time.sleep(self.latency)
+        with PostgrestStub.lock:
+            PostgrestStub.rows_received += rows
+            PostgrestStub.requests += 1
+        body = b"[]"
+        self.send_response(201)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def start_stub(latency_ms: float) -> ThreadingHTTPServer:
+    PostgrestStub.latency = latency_ms / 1000.0
+    server = ThreadingHTTPServer(("127.0.0.1", 0), PostgrestStub)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def reset_stub() -> None:
+    with PostgrestStub.lock:
+        PostgrestStub.rows_received = 0
+        PostgrestStub.requests = 0
+
+# ---------------------------
+# Synthetic data
+# ---------------------------
+def synthetic_columns(hours: int, num_keywords: int):
+    start = datetime(2026, 1, 1)
+    timestamps = [(start + timedelta(hours=h)).isoformat() for h in range(hours)]
+    columns = {f"kw{k}": [(h * 7 + k) % 101 for h in range(hours)] for k in range(num_keywords)}
+    return timestamps, columns
+
+# ---------------------------
+# Strategies
+# ---------------------------
+def legacy_loop(client, timestamps, columns) -> int:
+    """The original fetch_trends loop: one insert per keyword per row."""
+    written = 0
+    for i, ts in enumerate(timestamps):
+        for keyword, values in columns.items():
+            client.table(TRENDS_TABLE).insert({
+                "keyword": keyword,
+                "interest": values[i],
+                "fetched_at": ts,
+            }).execute()
+            written += 1
+    return written
+
+
+def bulk_upsert(client, timestamps, columns, chunk_size: int) -> int:
+    return upsert_rows(build_rows(timestamps, columns), chunk_size=chunk_size, client=client)
+
+
+def run(name: str, fn) -> None:
+    reset_stub()
+    started = time.perf_counter()
+    written = fn()
+    elapsed = time.perf_counter() - started
+    print(
+        f"{name:<24} rows={written:<6} requests={PostgrestStub.requests:<5} "
+        f"time={elapsed:8.3f}s  rows/sec={written / elapsed if elapsed else float('inf'):10.1f}"
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--hours", type=int, default=168, help="timestamps per keyword (now 7-d ≈ 168)")
+    parser.add_argument("--keywords", type=int, default=4)
+    parser.add_argument("--latency-ms", type=float, default=5.0, help="simulated round-trip latency per request")
+    parser.add_argument("--chunk-sizes", default="100,500,1000")
+    args = parser.parse_args()
+
+    server = start_stub(args.latency_ms)
+    url = f"http://127.0.0.1:{server.server_address[1]}"
+    client = create_client(url, "stub.stub.stub")
+    timestamps, columns = synthetic_columns(args.hours, args.keywords)
+
+    print(f"PostgREST stub at {url}, {args.hours}x{args.keywords} cells, {args.latency_ms} ms latency\n")
+    run("legacy per-cell insert", lambda: legacy_loop(client, timestamps, columns))
+    for size in (int(s) for s in args.chunk_sizes.split(",")):
+        run(f"bulk upsert chunk={size}", lambda: bulk_upsert(client, timestamps, columns, size))
+
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -10,20 +10,34 @@ import asyncio
 import logging
 import json
 from datetime import datetime
+from typing import Optional
 from fastapi import FastAPI, Request, HTTPException, Body, Query
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import Response, StreamingResponse
+from starlette.concurrency import run_in_threadpool
 from pydantic import BaseModel
-from apscheduler.schedulers.background import BackgroundScheduler
-from apscheduler.triggers.interval import IntervalTrigger
-from cachetools import TTLCache
-from pytrends.request import TrendReq
 from dotenv import load_dotenv
 
-from utils.supabase_client import supabase
-from utils.affiliate_links import get_affiliate_link
-from queue_manager import enqueue_prompt, start_workers  # <- Async queue system
-
-import httpx
+from utils.supabase_client import supabase, supabase_db
+from utils.affiliate_links import get_affiliate_link, link_cache, resolve_link
+from utils.utm import build_utm_url
+from utils.redirects import RedirectFastPath
+from trends.writer import write_trends
+from trends.sharding import TRENDS_KEYWORDS, fetch_sharded
+from trends.watermarks import watermarks
+from trends.timeseries import trend_store
+from trends.jobs import RefreshJobManager
+from utils.http_clients import http_clients
+from utils.search_cache import QuotaExhausted, search_cache
+from utils.storage import results_store
+from utils.click_pipeline import click_pipeline, client_fingerprint
+from utils.click_rollups import GROUP_FIELDS, click_rollups, to_minute
+from utils.retry import supabase_retry
+from utils.leader import scheduler_leader
+from utils.chat_stream import MEDIA_TYPES as STREAM_MEDIA_TYPES, stream_chat
+from queue_manager import (  # <- Async queue system
+    QueueRejected, enqueue_prompt, queue as ask_queue, start_workers, stats as ask_stats, stop_workers,
+)
 
 # ---------------- Environment & Logging ----------------
 load_dotenv()
@@ -56,56 +70,92 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# ---------------- Cache & Scheduler ----------------
-cache = TTLCache(maxsize=1, ttl=86400)
-CACHE_KEY = "trends_data"
-scheduler = BackgroundScheduler()
-scheduler.start()
-
 # ---------------- Pydantic Models ----------------
 class TrendRequest(BaseModel):
     topic: str
 
 # ---------------- Trend Fetching ----------------
-def fetch_trends():
-    """Fetch Google Trends and store in Supabase & cache"""
+def fetch_trends(progress=None, warn=None):
+    """
+    Fetch Google Trends and store in Supabase & the in-memory trend store.
+    Raises when every shard fails; failed shards of a partial fetch are passed to `warn`.
+    """
+    progress = progress or (lambda stage, fraction: None)
+    warn = warn or (lambda message: None)
     logging.info("📈 Fetching Google Trends...")
-    try:
-        pytrends = TrendReq(hl="en-US", tz=360)
-        keywords = ["python", "fastapi", "AI", "trending"]  # Can be dynamic
-        pytrends.build_payload(kw_list=keywords, timeframe="now 7-d", geo="US")
-        df = pytrends.interest_over_time()
-        if df.empty:
-            logging.warning("No trend data received")
-            return
+    progress("fetching", 0.0)
 
-        data = df.reset_index().to_dict(orient="records")
-        cache[CACHE_KEY] = data
-        logging.info("✅ Trends cached successfully")
+    # TRENDS_KEYWORDS env, sharded past the 5-term payload limit
+    timestamps, columns = fetch_sharded(
+        TRENDS_KEYWORDS,
+        on_shard=lambda done, total: progress("fetching", 0.8 * done / total),
+        on_shard_error=lambda shard, e: warn(f"Shard {shard} failed: {e}"),
+    )
+    keywords = list(columns)
+    if not timestamps:
+        logging.warning("No trend data received")
+        return 0
 
-        # Insert into Supabase
-        for record in data:
-            for keyword in keywords:
-                supabase.table("trends").insert({
-                    "keyword": keyword,
-                    "interest": record.get(keyword, 0),
-                    "fetched_at": record.get("date")
-                }).execute()
-        logging.info("✅ Trends inserted into Supabase")
+    trend_store.merge(timestamps, columns)
+    logging.info("✅ Trends loaded into the in-memory store")
 
-    except Exception as e:
-        logging.error(f"❌ Error in fetch_trends: {e}")
+    # Upsert only points past each keyword's watermark, keyed on (keyword, fetched_at)
+    progress("storing", 0.8)
+    start = watermarks.start_offsets(timestamps, keywords)
+    written = write_trends(timestamps, columns, start=start)
+    watermarks.advance(timestamps, keywords)
+    logging.info(f"✅ {written} new trend rows upserted into Supabase")
+    return written
+
+# Scheduled and manual refreshes share one single-flight job runner
+refresh_jobs = RefreshJobManager(fetch_trends)
+
+# ---------------- Scheduler ----------------
+# Only the elected leader process runs it (see utils/leader.py). It is created on
+# the elector's thread, so apscheduler's import never delays the first /health.
+scheduler = None
+
+def start_scheduler():
+    global scheduler
+    from apscheduler.schedulers.background import BackgroundScheduler
+    from apscheduler.triggers.interval import IntervalTrigger
+
+    scheduler = BackgroundScheduler()
+    # Schedule every 3 hours
+    scheduler.add_job(refresh_jobs.submit, IntervalTrigger(hours=3))
+    scheduler.start()
+    logging.info("⏰ Trend refresh scheduler started")
+
+def stop_scheduler():
+    if scheduler is not None and scheduler.running:
+        scheduler.shutdown(wait=False)
 
-# Schedule every 3 hours
-scheduler.add_job(fetch_trends, IntervalTrigger(hours=3))
+# Per-minute click counters are updated as the pipeline accepts each click
+click_pipeline.subscribe(click_rollups.observe)
 
 # ---------------- Startup Event ----------------
 @app.on_event("startup")
 async def startup_event():
+    await http_clients.start()
+    await run_in_threadpool(results_store.import_legacy, DATA_FILE)
+    await click_pipeline.start()
+    await click_rollups.start()
+    await link_cache.start()
     loop = asyncio.get_event_loop()
     start_workers(loop=loop)
+    scheduler_leader.start(on_elected=start_scheduler, on_demoted=stop_scheduler)
     logging.info("🩸 Blood API workers started.")
 
+@app.on_event("shutdown")
+async def shutdown_event():
+    await stop_workers()
+    await asyncio.get_event_loop().run_in_executor(None, scheduler_leader.stop)
+    await link_cache.stop()
+    await click_pipeline.stop()
+    await click_rollups.stop()
+    await http_clients.close()
+    supabase_db.close()
+
 # ---------------- Routes ----------------
 @app.get("/")
 def home():
@@ -115,19 +165,51 @@ def home():
 def health():
     return {"status": "ok"}
 
+@app.get("/metrics/http")
+def http_pool_metrics():
+    return {"pools": http_clients.stats()}
+
 @app.get("/daily-trends")
-def daily_trends():
+async def daily_trends(limit: int = Query(10, ge=1, le=1000)):
+    if len(trend_store):
+        return {"trends": trend_store.latest_rows(limit)}
+    # Cold start: nothing fetched in this process yet
     try:
-        result = supabase.table("trends").select("*").order("fetched_at", desc=True).limit(10).execute()
+        result = await supabase_db.execute(
+            supabase.table("trends").select("*").order("fetched_at", desc=True).limit(limit)
+        )
         return {"trends": result.data or []}
     except Exception as e:
         logging.error(e)
         raise HTTPException(status_code=500, detail="Failed to fetch trends")
 
-@app.get("/refresh-trends")
+@app.get("/trends/{keyword}")
+def keyword_trends(
+    keyword: str,
+    start: Optional[str] = Query(None, description="ISO timestamp, inclusive"),
+    end: Optional[str] = Query(None, description="ISO timestamp, inclusive"),
+    limit: Optional[int] = Query(None, ge=1, description="Return only the latest N points"),
+):
+    try:
+        points = trend_store.series(keyword, start=start, end=end, limit=limit)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid start/end timestamp")
+    if points is None:
+        raise HTTPException(status_code=404, detail="Keyword not tracked")
+    return {"keyword": keyword, "points": points}
+
+@app.get("/refresh-trends", status_code=202)
 def refresh_trends():
-    fetch_trends()
-    return {"message": "Trends refreshed manually"}
+    job, created = refresh_jobs.submit()
+    message = "Trend refresh started" if created else "Attached to trend refresh already in progress"
+    return {"message": message, "job_id": job.id, "status": job.status}
+
+@app.get("/refresh-trends/{job_id}")
+def refresh_trends_status(job_id: str):
+    job = refresh_jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Refresh job not found")
+    return job.to_dict()
 
 @app.post("/score-trend")
 async def score_trend(request: Request, trend_request: TrendRequest):
@@ -140,13 +222,54 @@ async def score_trend(request: Request, trend_request: TrendRequest):
 async def google_search(q: str = Query(...)):
     url = "https://www.googleapis.com/customsearch/v1"
     params = {"key": GOOGLE_API_KEY, "cx": CUSTOM_SEARCH_ENGINE_ID, "q": q}
-    async with httpx.AsyncClient() as client:
-        resp = await client.get(url, params=params, timeout=10)
-    if resp.status_code != 200:
-        raise HTTPException(status_code=resp.status_code, detail="Google API error")
-    data = resp.json()
-    items = data.get("items", [])
-    return {"query": q, "results": [{"title": i.get("title"), "link": i.get("link"), "snippet": i.get("snippet")} for i in items]}
+
+    async def fetch():
+        resp = await http_clients.get("google_cse").get(url, params=params)
+        if resp.status_code != 200:
+            raise HTTPException(status_code=resp.status_code, detail="Google API error")
+        items = resp.json().get("items", [])
+        return [{"title": i.get("title"), "link": i.get("link"), "snippet": i.get("snippet")} for i in items]
+
+    try:
+        results, status = await search_cache.get_or_fetch(q, fetch)
+    except HTTPException as e:
+        if e.status_code != 429:
+            raise
+        try:
+            results, status = search_cache.serve_stale(q)
+        except QuotaExhausted:
+            raise e
+    except QuotaExhausted:
+        raise HTTPException(status_code=429, detail="Google search quota exhausted")
+    return {"query": q, "results": results, "cache": status}
+
+@app.get("/metrics/clicks")
+def click_pipeline_metrics():
+    return click_pipeline.stats()
+
+@app.get("/metrics/click-rollups")
+def click_rollup_metrics():
+    return click_rollups.stats()
+
+@app.get("/metrics/links")
+def link_cache_metrics():
+    return link_cache.stats()
+
+@app.get("/metrics/scheduler")
+def scheduler_metrics():
+    jobs = scheduler.get_jobs() if scheduler is not None and scheduler.running else []
+    return {
+        **scheduler_leader.stats(),
+        "jobs": [{"name": job.name, "next_run": str(job.next_run_time)} for job in jobs],
+    }
+
+@app.get("/metrics/supabase")
+def supabase_metrics():
+    return {**supabase_db.stats(), "retry": supabase_retry.stats()}
+
+@app.get("/metrics/google-search")
+def google_search_metrics():
+    return search_cache.stats()
 
 @app.post("/chat")
 async def chat(request: Request, body: dict = Body(...)):
@@ -155,14 +278,26 @@ async def chat(request: Request, body: dict = Body(...)):
     prompt = body.get("prompt")
     if not prompt:
         raise HTTPException(status_code=400, detail="Prompt required")
-    async with httpx.AsyncClient() as client:
-        resp = await client.post(
-            OLLAMA_URL,
-            json={"model": "llama2:latest", "messages": [{"role": "user", "content": prompt}], "stream": False},
-            timeout=30.0
+    payload = {"model": "llama2:latest", "messages": [{"role": "user", "content": prompt}]}
+
+    # Streaming mode: {"stream": true, "format": "sse" | "ndjson"} or Accept: text/event-stream
+    wants_sse = "text/event-stream" in request.headers.get("Accept", "")
+    if body.get("stream") or wants_sse:
+        fmt = body.get("format", "sse")
+        if fmt not in STREAM_MEDIA_TYPES:
+            raise HTTPException(status_code=400, detail="format must be 'sse' or 'ndjson'")
+        return StreamingResponse(
+            stream_chat(http_clients.get("ollama"), OLLAMA_URL, payload, request, fmt),
+            media_type=STREAM_MEDIA_TYPES[fmt],
+            headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
         )
-        resp.raise_for_status()
-        return resp.json()
+
+    # Blocking fallback
+    resp = await http_clients.get("ollama").post(OLLAMA_URL, json={**payload, "stream": False})
+    resp.raise_for_status()
+    return resp.json()
+
+DEFAULT_AFFILIATE_URL = "https://your-default-affiliate.com"
 
 @app.post("/generate-link")
 async def generate_link(request: Request):
@@ -171,64 +306,205 @@ async def generate_link(request: Request):
     source = data.get("source", "autoloop")
     medium = data.get("medium", "affiliate")
     campaign = data.get("campaign", "default")
-    default_url = "https://your-default-affiliate.com"
 
-    redirect_url = get_affiliate_link(link_id, default_url)
-    if not redirect_url:
+    # Link lookup is a blocking Supabase call on a cache miss; keep it off the event loop.
+    # The returned URL already carries the UTM params.
+    utm_link = await supabase_db.run(
+        get_affiliate_link, link_id, DEFAULT_AFFILIATE_URL,
+        utm_source=source, utm_medium=medium, utm_campaign=campaign,
+    )
+    if not utm_link:
         raise HTTPException(status_code=404, detail="Affiliate link not found")
 
-    if "?" in redirect_url:
-        utm_link = f"{redirect_url}&utm_source={source}&utm_medium={medium}&utm_campaign={campaign}"
-    else:
-        utm_link = f"{redirect_url}?utm_source={source}&utm_medium={medium}&utm_campaign={campaign}"
+    # Without a link_id there is nothing to attribute the click to (and link_id is
+    # part of every click and rollup key), so only the fallback URL is returned
+    if not link_id:
+        return {"redirectUrl": utm_link, "clickId": None}
+
+    # One click event per click: retries/replays within the dedupe window reuse its click_id
+    click_id, _ = click_pipeline.record_click(
+        link_id, source, medium, campaign,
+        click_id=data.get("click_id") or request.headers.get("Idempotency-Key"),
+        fingerprint=request_fingerprint(request),
+    )
+    return {"redirectUrl": utm_link, "clickId": click_id}
+
+def request_fingerprint(request: Request) -> str:
+    return client_fingerprint(
+        request.client.host if request.client else None,
+        request.headers.get("X-Forwarded-For"),
+        request.headers.get("User-Agent"),
+    )
+
+async def resolve_redirect(
+    link_id: str,
+    source: str,
+    medium: str,
+    campaign: str,
+    click_id: Optional[str] = None,
+    fingerprint: Optional[str] = None,
+    record: bool = True,
+):
+    """
+    Resolve link_id to its UTM-tagged target and record the click once. With
+    record=False (HEAD requests from unfurlers and crawlers) nothing is recorded
+    and the returned click_id is None.
+    """
+    cached, url = link_cache.get(link_id)
+    if not cached:
+        try:
+            url = await supabase_db.run(resolve_link, link_id)
+        except Exception as e:
+            # Supabase down or circuit open: send the visitor to the default URL
+            # (not cached, so the next click retries the lookup) and still count the click
+            logging.warning(f"⚠️ Link lookup for {link_id} failed, redirecting to the default URL: {e}")
+    if not record:
+        return build_utm_url(url or DEFAULT_AFFILIATE_URL, source, medium, campaign), None
+    click_id, _ = click_pipeline.record_click(
+        link_id, source, medium, campaign, click_id=click_id, fingerprint=fingerprint,
+    )
+    return build_utm_url(url or DEFAULT_AFFILIATE_URL, source, medium, campaign), click_id
+
+@app.get("/r/{link_id}", status_code=302)
+async def redirect_link(
+    request: Request,
+    link_id: str,
+    source: str = "autoloop",
+    medium: str = "affiliate",
+    campaign: str = "default",
+    click_id: Optional[str] = None,
+):
+    """Resolve a link and 302 straight to the UTM-tagged URL (served by RedirectFastPath)."""
+    target, click_id = await resolve_redirect(
+        link_id, source, medium, campaign,
+        click_id=click_id or request.headers.get("Idempotency-Key"),
+        fingerprint=request_fingerprint(request),
+    )
+    return Response(
+        status_code=302,
+        headers={"Location": target, "Cache-Control": "no-store", "X-Click-Id": click_id},
+    )
 
+# Answers /r/{link_id} ahead of routing and the other middleware
+app.add_middleware(RedirectFastPath, resolve=resolve_redirect)
+
+@app.get("/clicks/stats")
+async def click_stats(
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    group_by: str = Query("link", regex=f"^({'|'.join(GROUP_FIELDS)})$"),
+    top: int = Query(10, ge=1, le=1000),
+    link_id: Optional[str] = None,
+    source: str = Query("auto", regex="^(auto|memory|table)$"),
+):
+    """
+    Click totals, per-minute series and top-N groups for [start, end] (default: last hour).
+    `auto` answers from in-memory rollups when they cover the range (started after this
+    process began counting, single writer), else from the table. `memory` forces this
+    process's own counters, which miss clicks served by other workers.
+    """
+    end_minute = to_minute(end or datetime.utcnow())
+    start_minute = to_minute(start) if start else end_minute - 59
+    if start_minute > end_minute:
+        raise HTTPException(status_code=400, detail="start must be before end")
+    if source == "memory" or (source == "auto" and click_rollups.covers(start_minute)):
+        stats = click_rollups.query(start_minute, end_minute, group_by, top, link_id)
+        stats["source"] = "memory"
+        return stats
     try:
-        supabase.table("affiliate_clicks").insert({
-            "link_id": link_id,
-            "clicked_at": datetime.utcnow().isoformat(),
-            "utm_source": source,
-            "utm_medium": medium,
-            "utm_campaign": campaign
-        }).execute()
+        stats = await supabase_db.run(click_rollups.query_table, start_minute, end_minute, group_by, top, link_id)
     except Exception as e:
-        logging.error(f"❌ Error logging click: {e}")
+        logging.error(f"❌ Error reading click rollups: {e}")
+        raise HTTPException(status_code=503, detail="Click rollups unavailable")
+    stats["source"] = "table"
+    return stats
 
-    return {"redirectUrl": utm_link}
+@app.post("/affiliate-links/invalidate")
+async def invalidate_affiliate_links(request: Request, body: dict = Body(default={})):
+    if request.headers.get("Authorization") != f"Bearer {API_KEY}":
+        raise HTTPException(status_code=401, detail="Unauthorized")
+    link_id = body.get("link_id")
+    if link_id:
+        link_cache.invalidate(link_id)
+        return {"invalidated": link_id}
+    # No link_id: drop everything and reload the whole table
+    link_cache.invalidate()
+    try:
+        count = await supabase_db.run(link_cache.preload)
+    except Exception as e:
+        logging.error(f"❌ Error reloading affiliate links: {e}")
+        raise HTTPException(status_code=503, detail="Affiliate link reload failed")
+    return {"invalidated": "all", "reloaded": count}
 
-# ---------------- Local JSON storage ----------------
-DATA_FILE = "trends_output.json"
+# ---------------- Local JSONL storage ----------------
+DATA_FILE = "trends_output.json"  # legacy single-file store, imported once on startup
 
 @app.post("/api/update")
 async def update_results(request: Request):
     body = await request.json()
-    data = []
-    if os.path.exists(DATA_FILE):
-        with open(DATA_FILE, "r") as f:
-            data = json.load(f)
-    data.append(body)
-    with open(DATA_FILE, "w") as f:
-        json.dump(data, f, indent=2)
-    return {"status": "✅ Stored successfully", "item": body}
+    seq = await run_in_threadpool(results_store.append, body)
+    return {"status": "✅ Stored successfully", "item": body, "id": seq}
 
 @app.get("/api/results")
-def get_results():
-    if os.path.exists(DATA_FILE):
-        with open(DATA_FILE) as f:
-            return json.load(f)
-    return {"message": "No data yet."}
+def get_results(
+    cursor: int = Query(0, ge=0, description="Sequence number to start from"),
+    limit: int = Query(100, ge=1, le=1000),
+    stream: bool = Query(False, description="Stream every record from cursor as NDJSON"),
+):
+    if stream:
+        lines = (json.dumps({"id": seq, "item": item}) + "\n" for seq, item in results_store.iter_from(cursor))
+        return StreamingResponse(lines, media_type="application/x-ndjson")
+    items, next_cursor = results_store.page(cursor, limit)
+    if not items and cursor == 0:
+        return {"message": "No data yet."}
+    return {"items": items, "next_cursor": next_cursor}
 
 # ---------------- Async /ask endpoint ----------------
+async def wait_for_disconnect(request: Request):
+    """Return once the client closes the connection (the body has already been read)."""
+    while True:
+        message = await request.receive()
+        if message["type"] == "http.disconnect":
+            return
+
 @app.post("/ask")
 async def ask(request: Request):
     data = await request.json()
     prompt = data.get("prompt")
     conversation_id = data.get("conversation_id", "default")
+    priority = data.get("priority", ask_queue.default_priority)
+    timeout = data.get("timeout")
     
     if not prompt:
         raise HTTPException(status_code=400, detail="Prompt is required")
+    if priority not in ask_queue.classes:
+        raise HTTPException(status_code=400, detail=f"priority must be one of: {', '.join(ask_queue.classes)}")
+    if timeout is not None and (not isinstance(timeout, (int, float)) or timeout <= 0):
+        raise HTTPException(status_code=400, detail="timeout must be a positive number of seconds")
     
+    # Race the answer against the client going away; cancelling the wait withdraws
+    # this request from its queue item so the Mind agent is not called for nobody
+    answer_task = asyncio.ensure_future(enqueue_prompt(prompt, conversation_id, priority, timeout))
+    disconnect_task = asyncio.ensure_future(wait_for_disconnect(request))
     try:
-        answer = await enqueue_prompt(prompt, conversation_id)
-        return {"answer": answer}
+        await asyncio.wait({answer_task, disconnect_task}, return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        disconnect_task.cancel()
+    if not answer_task.done():
+        answer_task.cancel()
+        logging.info(f"🔌 /ask client for {conversation_id} disconnected; request withdrawn")
+        return Response(status_code=499)
+    
+    try:
+        return {"answer": answer_task.result()}
+    except QueueRejected as e:
+        # Shed load early instead of letting the request time out in the queue
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": str(e.retry_after)})
+    except asyncio.TimeoutError:
+        raise HTTPException(status_code=504, detail="Timed out waiting for the Mind agent")
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/metrics/ask")
+def ask_queue_metrics():
+    return ask_stats()
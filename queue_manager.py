@@ -1,37 +1,283 @@
 import asyncio
+import hashlib
 import logging
+import os
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Tuple
 
-# Global async queue
-queue = asyncio.Queue()
+from utils.fair_queue import FairQueue, QueueRejected  # noqa: F401 (QueueRejected re-exported for callers)
+from utils.http_clients import http_clients
+from utils.worker_pool import ASK_AUTOSCALE, Autoscaler, WorkerPool
+
+# Mind agent endpoints. Without MIND_AGENT_URL prompts are answered by the local simulation;
+# with MIND_AGENT_BATCH_URL workers send micro-batches instead of one prompt per call
+MIND_AGENT_URL = os.getenv("MIND_AGENT_URL")
+MIND_AGENT_BATCH_URL = os.getenv("MIND_AGENT_BATCH_URL")
+ASK_BATCH_MAX_SIZE = int(os.getenv("ASK_BATCH_MAX_SIZE", 16))
+ASK_BATCH_MAX_DELAY_MS = float(os.getenv("ASK_BATCH_MAX_DELAY_MS", 25))
+
+# Identical (conversation, prompt) submissions share one queued item while it is
+# pending, and completed answers are replayed for a few seconds (n8n retries)
+ASK_RESULT_CACHE_TTL = float(os.getenv("ASK_RESULT_CACHE_TTL", 15))
+ASK_RESULT_CACHE_MAX = int(os.getenv("ASK_RESULT_CACHE_MAX", 1024))
+
+# Every queued prompt carries a deadline (seconds from submission, per-request
+# timeout capped at ASK_MAX_TIMEOUT). Expired or abandoned items are dropped
+# before dispatch, and an in-flight upstream call is aborted once nobody waits for it.
+ASK_DEFAULT_TIMEOUT = float(os.getenv("ASK_DEFAULT_TIMEOUT", 120))
+ASK_MAX_TIMEOUT = float(os.getenv("ASK_MAX_TIMEOUT", 300))
+
+# Global fair queue: round-robin across conversations, weighted across priority classes.
+# Bounded: put() raises QueueRejected when full or when the expected wait is too long.
+queue = FairQueue()
+
+PromptKey = Tuple[str, str]
+_pending: Dict[PromptKey, Dict[str, Any]] = {}
+_results: "OrderedDict[PromptKey, Tuple[float, Any]]" = OrderedDict()
+dedupe_counters = {"submitted": 0, "coalesced": 0, "cache_hits": 0}
+batch_counters = {"batches": 0, "items": 0, "failed_batches": 0}
+cancel_counters = {"abandoned": 0, "timed_out": 0, "aborted_upstream": 0}
+
+def prompt_key(prompt: str, conversation_id: str) -> PromptKey:
+    return conversation_id, hashlib.sha1(prompt.encode()).hexdigest()
+
+def _cached_result(key: PromptKey):
+    entry = _results.get(key)
+    if entry is None:
+        return False, None
+    if entry[0] <= time.monotonic():
+        del _results[key]
+        return False, None
+    return True, entry[1]
+
+def _settle(key: PromptKey, item: Dict[str, Any], future: asyncio.Future):
+    """Done-callback: stop coalescing onto `item` and cache a successful answer."""
+    if _pending.get(key) is item:
+        del _pending[key]
+    if future.cancelled() or future.exception() is not None:
+        return
+    _results[key] = (time.monotonic() + ASK_RESULT_CACHE_TTL, future.result())
+    _results.move_to_end(key)
+    while len(_results) > ASK_RESULT_CACHE_MAX:
+        _results.popitem(last=False)
 
 async def handle_prompt(prompt: str, conversation_id: str):
-    """Simulate AI processing for a prompt."""
+    """Send one prompt to the Mind agent (or simulate AI processing when none is configured)."""
     logging.info(f"🧠 Processing prompt for {conversation_id}: {prompt}")
-    await asyncio.sleep(1)  # Simulated delay
-    return f"Response to: {prompt}"
-
-async def worker():
-    """Worker task that processes queued prompts asynchronously."""
-    while True:
-        prompt, conversation_id, future = await queue.get()
-        try:
-            result = await handle_prompt(prompt, conversation_id)
-            future.set_result(result)
-        except Exception as e:
-            future.set_exception(e)
-        finally:
-            queue.task_done()
-
-async def enqueue_prompt(prompt: str, conversation_id: str):
-    """Add a prompt to the queue and wait for the response."""
+    if not MIND_AGENT_URL:
+        await asyncio.sleep(1)  # Simulated delay
+        return f"Response to: {prompt}"
+    response = await http_clients.get("mind").post(
+        MIND_AGENT_URL, json={"prompt": prompt, "conversation_id": conversation_id},
+    )
+    response.raise_for_status()
+    return response.json().get("output", "No response received.")
+
+async def handle_batch(items: List[Dict[str, Any]]) -> List[Any]:
+    """
+    POST {"prompts": [{"prompt", "conversation_id"}, ...]} to the batch endpoint and
+    return its "outputs" list, in the same order.
+    """
+    response = await http_clients.get("mind").post(
+        MIND_AGENT_BATCH_URL,
+        json={"prompts": [{"prompt": i["prompt"], "conversation_id": i["conversation_id"]} for i in items]},
+    )
+    response.raise_for_status()
+    outputs = response.json().get("outputs")
+    if not isinstance(outputs, list) or len(outputs) != len(items):
+        raise ValueError(f"Batch endpoint returned {len(outputs or [])} outputs for {len(items)} prompts")
+    return outputs
+
+def batch_plan(depth: int) -> Tuple[int, float]:
+    """
+    (max items, max wait in seconds) for the next batch given the queue depth.
+    An idle queue sends at once (no added latency); the deeper the backlog, the
+    longer a worker may wait to fill a batch, up to ASK_BATCH_MAX_DELAY_MS.
+    """
+    if depth <= 0:
+        return 1, 0.0
+    size = min(ASK_BATCH_MAX_SIZE, depth + 1)
+    return size, ASK_BATCH_MAX_DELAY_MS / 1000 * size / ASK_BATCH_MAX_SIZE
+
+async def collect_batch(first: Dict[str, Any]) -> List[Dict[str, Any]]:
     loop = asyncio.get_event_loop()
-    future = loop.create_future()
-    await queue.put((prompt, conversation_id, future))
-    return await future
-
-def start_workers(loop=None, num_workers=2):
-    """Start background async workers."""
-    loop = loop or asyncio.get_event_loop()
-    for _ in range(num_workers):
-        loop.create_task(worker())
-    logging.info(f"🚀 Started {num_workers} async workers.")
+    limit, delay = batch_plan(len(queue))
+    deadline = loop.time() + delay
+    batch = [first]
+    while len(batch) < limit:
+        item = queue.get_nowait()
+        if item is not None:
+            batch.append(item)
+            continue
+        remaining = deadline - loop.time()
+        if remaining <= 0:
+            break
+        await queue.wait_changed(remaining)
+    return batch
+
+class Abandoned(Exception):
+    """Every requester of a dispatched prompt went away before the upstream call finished."""
+
+
+class DeadlineExceeded(asyncio.TimeoutError):
+    """The requesters' deadline passed while the upstream call was still running."""
+
+
+async def run_for_waiters(batch: List[Dict[str, Any]], call):
+    """
+    Await the upstream coroutine `call` while someone still waits for `batch`.
+    Cancels it (which aborts the HTTP request) when every item's future is done,
+    raising Abandoned, or when the latest deadline in the batch passes, raising
+    DeadlineExceeded. Deadlines are re-read each round, since a coalesced
+    duplicate may extend them while the call runs.
+    """
+    task = asyncio.ensure_future(call)
+    try:
+        while not task.done():
+            waiting = [i["future"] for i in batch if not i["future"].done()]
+            if not waiting:
+                raise Abandoned()
+            remaining = max(i["deadline"] for i in batch) - time.monotonic()
+            if remaining <= 0:
+                raise DeadlineExceeded("deadline passed before the Mind agent answered")
+            await asyncio.wait([task, *waiting], timeout=remaining, return_when=asyncio.FIRST_COMPLETED)
+        return task.result()
+    finally:
+        if not task.done():
+            task.cancel()
+            cancel_counters["aborted_upstream"] += 1
+
+def _resolve(item: Dict[str, Any], result: Any = None, error: Exception = None):
+    future = item["future"]
+    if future.done():
+        return
+    if error is not None:
+        future.set_exception(error)
+    else:
+        future.set_result(result)
+
+async def process(item: Dict[str, Any]):
+    """Handle one dequeued prompt (plus any micro-batch collected with it)."""
+    batch = await collect_batch(item) if MIND_AGENT_BATCH_URL else [item]
+    started = time.monotonic()
+    try:
+        if not MIND_AGENT_BATCH_URL:
+            _resolve(item, await run_for_waiters(batch, handle_prompt(item["prompt"], item["conversation_id"])))
+        else:
+            # Requesters may have left while the batch was being collected
+            live = [queued for queued in batch if not queued["future"].done()] or batch
+            batch_counters["batches"] += 1
+            batch_counters["items"] += len(live)
+            for queued, output in zip(live, await run_for_waiters(live, handle_batch(live))):
+                _resolve(queued, output)
+        pool.observe(time.monotonic() - started, ok=True)
+    except Abandoned:
+        logging.info(f"🛑 Aborted upstream call for {len(batch)} prompt(s): requesters went away")
+    except DeadlineExceeded as e:
+        # The client's own deadline, not an upstream failure: keep it out of the autoscaler's error rate
+        logging.warning(f"⏱️ Aborted upstream call for {len(batch)} prompt(s): {e}")
+        for queued in batch:
+            _resolve(queued, error=e)
+    except Exception as e:
+        pool.observe(time.monotonic() - started, ok=False)
+        if MIND_AGENT_BATCH_URL:
+            batch_counters["failed_batches"] += 1
+        logging.error(f"❌ Error processing {len(batch)} prompt(s): {e}")
+        for queued in batch:
+            _resolve(queued, error=e)
+    finally:
+        for queued in batch:
+            queue.task_done(queued, batch_size=len(batch))
+
+# Worker tasks, resized between ASK_MIN_WORKERS and ASK_MAX_WORKERS by the autoscaler
+pool = WorkerPool(queue, process)
+autoscaler = Autoscaler(pool)
+
+def request_timeout(timeout: float = None) -> float:
+    """Per-request timeout in seconds: the default when unset, capped at ASK_MAX_TIMEOUT."""
+    if timeout is None:
+        return ASK_DEFAULT_TIMEOUT
+    return min(max(float(timeout), 0.0), ASK_MAX_TIMEOUT)
+
+async def _wait(item: Dict[str, Any], timeout: float):
+    """
+    Wait for `item` as one of its requesters. When the last requester leaves
+    (timeout, or its task is cancelled on disconnect) the item is taken out of the
+    queue and its future cancelled, which aborts its upstream call if dispatched.
+    """
+    item["waiters"] += 1
+    try:
+        return await asyncio.wait_for(asyncio.shield(item["future"]), timeout)
+    except asyncio.TimeoutError:
+        cancel_counters["timed_out"] += 1
+        raise
+    finally:
+        item["waiters"] -= 1
+        if item["waiters"] == 0 and not item["future"].done():
+            cancel_counters["abandoned"] += 1
+            queue.discard(item)
+            item["future"].cancel()
+
+async def enqueue_prompt(prompt: str, conversation_id: str, priority: str = None, timeout: float = None):
+    """
+    Add a prompt to the queue and wait up to `timeout` seconds for the response
+    (asyncio.TimeoutError after that). Repeats of a prompt that is still pending
+    attach to its item; repeats just after it finished get the cached answer.
+    Cancelling the calling task withdraws this request from the item.
+    """
+    dedupe_counters["submitted"] += 1
+    timeout = request_timeout(timeout)
+    key = prompt_key(prompt, conversation_id)
+    hit, result = _cached_result(key)
+    if hit:
+        dedupe_counters["cache_hits"] += 1
+        return result
+    pending = _pending.get(key)
+    # A just-abandoned item stays in _pending until its done-callback runs; don't attach to it
+    if pending is not None and not pending["future"].done():
+        dedupe_counters["coalesced"] += 1
+        # Keep the shared item alive for as long as its most patient requester
+        pending["deadline"] = max(pending["deadline"], time.monotonic() + timeout)
+        return await _wait(pending, timeout)
+
+    loop = asyncio.get_event_loop()
+    item = {
+        "prompt": prompt,
+        "conversation_id": conversation_id,
+        "priority": priority or queue.default_priority,
+        "future": loop.create_future(),
+        "deadline": time.monotonic() + timeout,
+        "waiters": 0,
+    }
+    await queue.put(item)
+    _pending[key] = item
+    item["future"].add_done_callback(lambda f: _settle(key, item, f))
+    return await _wait(item, timeout)
+
+def stats():
+    return {
+        **queue.stats(),
+        "dedupe": {**dedupe_counters, "pending": len(_pending), "cached_results": len(_results)},
+        "cancellation": {**cancel_counters, "default_timeout_s": ASK_DEFAULT_TIMEOUT, "max_timeout_s": ASK_MAX_TIMEOUT},
+        "batching": {
+            **batch_counters,
+            "enabled": bool(MIND_AGENT_BATCH_URL),
+            "avg_size": round(batch_counters["items"] / batch_counters["batches"], 2) if batch_counters["batches"] else None,
+            "max_size": ASK_BATCH_MAX_SIZE,
+            "max_delay_ms": ASK_BATCH_MAX_DELAY_MS,
+        },
+        "autoscaler": autoscaler.stats(),
+    }
+
+def start_workers(loop=None, num_workers=None):
+    """Start background async workers (ASK_MIN_WORKERS by default) and the autoscaler."""
+    pool.loop = loop or pool.loop
+    pool.resize(num_workers or pool.min_workers)
+    if ASK_AUTOSCALE:
+        autoscaler.start()
+    logging.info(f"🚀 Started {pool.size} async workers.")
+
+async def stop_workers():
+    await autoscaler.stop()
+    await pool.stop()
@@ -0,0 +1,10 @@
+-- Unique key for bulk trend upserts (on_conflict = "keyword,fetched_at").
+-- Drop duplicate rows left behind by the old per-cell insert loop first.
+delete from public.trends a
+using public.trends b
+where a.ctid < b.ctid
+  and a.keyword = b.keyword
+  and a.fetched_at = b.fetched_at;
+
+create unique index if not exists trends_keyword_fetched_at_key
+  on public.trends (keyword, fetched_at);
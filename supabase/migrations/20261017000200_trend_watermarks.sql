@@ -0,0 +1,6 @@
+-- Per-keyword high-water marks for incremental trend ingestion.
+create table if not exists public.trend_watermarks (
+  keyword text primary key,
+  fetched_at timestamp not null,
+  updated_at timestamptz not null default now()
+);
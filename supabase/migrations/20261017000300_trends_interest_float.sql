@@ -0,0 +1,3 @@
+-- Sharded fetches rescale interest onto a common scale, so values are fractional.
+alter table public.trends
+  alter column interest type double precision using interest::double precision;
@@ -0,0 +1,5 @@
+-- Idempotent click ids: replays and WAL re-sends are ignored on conflict.
+alter table public.affiliate_clicks add column if not exists click_id text;
+
+create unique index if not exists affiliate_clicks_click_id_key
+  on public.affiliate_clicks (click_id);
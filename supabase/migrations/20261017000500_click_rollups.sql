@@ -0,0 +1,30 @@
+-- Per-minute click counters keyed by link and UTM values.
+create table if not exists public.click_rollups (
+  minute       timestamptz not null,
+  link_id      text not null,
+  utm_source   text not null default '',
+  utm_medium   text not null default '',
+  utm_campaign text not null default '',
+  clicks       bigint not null default 0,
+  primary key (minute, link_id, utm_source, utm_medium, utm_campaign)
+);
+
+create index if not exists click_rollups_link_minute_idx
+  on public.click_rollups (link_id, minute);
+
+-- Adds deltas instead of overwriting, so every API worker can flush its own counters.
+create or replace function public.increment_click_rollups(rows jsonb)
+returns void
+language sql
+as $$
+  insert into public.click_rollups as r (minute, link_id, utm_source, utm_medium, utm_campaign, clicks)
+  select (x->>'minute')::timestamptz,
+         x->>'link_id',
+         coalesce(x->>'utm_source', ''),
+         coalesce(x->>'utm_medium', ''),
+         coalesce(x->>'utm_campaign', ''),
+         (x->>'clicks')::bigint
+  from jsonb_array_elements(rows) as x
+  on conflict (minute, link_id, utm_source, utm_medium, utm_campaign)
+  do update set clicks = r.clicks + excluded.clicks;
+$$;
@@ -0,0 +1,38 @@
+-- Makes increment_click_rollups idempotent: each flush carries a batch id, and a
+-- batch that was already applied (e.g. a retry after an ambiguous timeout) is a no-op.
+create table if not exists public.click_rollup_batches (
+  batch_id   uuid primary key,
+  applied_at timestamptz not null default now()
+);
+
+create index if not exists click_rollup_batches_applied_at_idx
+  on public.click_rollup_batches (applied_at);
+
+drop function if exists public.increment_click_rollups(jsonb);
+
+-- Batch ids are kept for a day; workers resend an unacknowledged batch long before that.
+create or replace function public.increment_click_rollups(rows jsonb, batch_id uuid)
+returns void
+language plpgsql
+as $$
+begin
+  insert into public.click_rollup_batches (batch_id) values (increment_click_rollups.batch_id)
+  on conflict do nothing;
+  if not found then
+    return;
+  end if;
+
+  insert into public.click_rollups as r (minute, link_id, utm_source, utm_medium, utm_campaign, clicks)
+  select (x->>'minute')::timestamptz,
+         x->>'link_id',
+         coalesce(x->>'utm_source', ''),
+         coalesce(x->>'utm_medium', ''),
+         coalesce(x->>'utm_campaign', ''),
+         (x->>'clicks')::bigint
+  from jsonb_array_elements(rows) as x
+  on conflict (minute, link_id, utm_source, utm_medium, utm_campaign)
+  do update set clicks = r.clicks + excluded.clicks;
+
+  delete from public.click_rollup_batches where applied_at < now() - interval '1 day';
+end;
+$$;
@@ -0,0 +1,23 @@
+"""
+Shared setup for the unit tests.
+The repo root holds an asyncio.py that would shadow the stdlib, so it is
+appended to sys.path rather than prepended; run the suite with the `pytest`
+script (not `python -m pytest` from the root, which puts the root first).
+"""
+
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.append(ROOT)
+
+# Modules read their configuration at import time
+for key, value in {
+    "SUPABASE_URL": "http://127.0.0.1:1",
+    "SUPABASE_KEY": "stub.stub.stub",
+    "GOOGLE_API_KEY": "test",
+    "CUSTOM_SEARCH_ENGINE_ID": "test",
+    "API_KEY": "test",
+}.items():
+    os.environ.setdefault(key, value)
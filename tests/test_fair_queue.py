@@ -0,0 +1,66 @@
+from utils.fair_queue import FairQueue
+
+
+def make_queue(**kwargs) -> FairQueue:
+    return FairQueue(weights={"high": 2, "low": 1}, default_priority="low", **kwargs)
+
+
+def drain(queue: FairQueue):
+    order = []
+    while True:
+        item = queue.get_nowait()
+        if item is None:
+            return order
+        order.append(item)
+        queue.task_done(item)
+
+
+def test_classes_are_served_by_weight():
+    queue = make_queue(max_inflight_per_conversation=10)
+    for i in range(4):
+        queue.put_nowait({"conversation_id": f"h{i}", "priority": "high"})
+        queue.put_nowait({"conversation_id": f"l{i}", "priority": "low"})
+
+    priorities = [item["priority"] for item in drain(queue)]
+
+    # high:2,low:1 -> two high for every low until high runs dry
+    assert priorities == ["high", "high", "low", "high", "high", "low", "low", "low"]
+
+
+def test_low_class_is_not_starved_by_a_busy_high_class():
+    queue = make_queue(max_inflight_per_conversation=10)
+    for i in range(10):
+        queue.put_nowait({"conversation_id": f"h{i}", "priority": "high"})
+    queue.put_nowait({"conversation_id": "l", "priority": "low"})
+
+    priorities = [item["priority"] for item in drain(queue)]
+
+    assert priorities.index("low") == 2
+
+
+def test_conversations_take_turns_within_a_class():
+    queue = make_queue(max_inflight_per_conversation=10)
+    for n in range(3):
+        queue.put_nowait({"conversation_id": "flood", "n": n})
+    queue.put_nowait({"conversation_id": "quiet", "n": 0})
+
+    order = [(item["conversation_id"], item["n"]) for item in drain(queue)]
+
+    assert order == [("flood", 0), ("quiet", 0), ("flood", 1), ("flood", 2)]
+
+
+def test_inflight_cap_skips_a_busy_conversation_until_task_done():
+    queue = make_queue(max_inflight_per_conversation=1)
+    first = {"conversation_id": "a", "n": 0}
+    queue.put_nowait(first)
+    queue.put_nowait({"conversation_id": "a", "n": 1})
+    queue.put_nowait({"conversation_id": "b", "n": 0})
+
+    assert queue.get_nowait() is first
+    assert queue.get_nowait()["conversation_id"] == "b"
+    # Only capped work is left
+    assert queue.get_nowait() is None
+    assert len(queue) == 1
+
+    queue.task_done(first)
+    assert queue.get_nowait()["n"] == 1
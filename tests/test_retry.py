@@ -0,0 +1,208 @@
+import asyncio
+
+import httpx
+import pytest
+
+from utils import retry
+from utils.retry import CircuitBreaker, CircuitOpenError, RetryBudget, RetryPolicy, is_transient_error
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    fake = Clock()
+    monkeypatch.setattr(retry.time, "monotonic", fake)
+    return fake
+
+
+class StatusError(Exception):
+    def __init__(self, status_code: int):
+        super().__init__(f"HTTP {status_code}")
+        self.status_code = status_code
+
+
+# ---- transient classification ----
+@pytest.mark.parametrize("error, transient", [
+    (httpx.ConnectError("refused"), True),
+    (TimeoutError(), True),
+    (StatusError(503), True),
+    (StatusError(429), True),
+    (StatusError(409), False),
+    (StatusError(400), False),
+])
+def test_is_transient_error(error, transient):
+    assert is_transient_error(error) is transient
+
+
+# ---- circuit breaker ----
+def test_breaker_opens_after_threshold_and_rejects(clock):
+    breaker = CircuitBreaker("t", threshold=3, reset_timeout=10)
+    for _ in range(2):
+        breaker.record_failure()
+    assert breaker.state == "closed"
+    breaker.record_failure()
+
+    assert breaker.state == "open"
+    assert not breaker.allow()
+    assert breaker.counters == {"rejected": 1, "opened": 1}
+
+
+def test_breaker_success_resets_the_failure_streak(clock):
+    breaker = CircuitBreaker("t", threshold=2, reset_timeout=10)
+    breaker.record_failure()
+    breaker.record_success()
+    breaker.record_failure()
+
+    assert breaker.state == "closed"
+
+
+def test_breaker_half_open_admits_one_probe_then_closes(clock):
+    breaker = CircuitBreaker("t", threshold=1, reset_timeout=10)
+    breaker.record_failure()
+    clock.now += 10
+
+    assert breaker.allow()
+    assert breaker.state == "half_open"
+    assert not breaker.allow()  # the probe is still out
+    breaker.record_success()
+
+    assert breaker.state == "closed"
+    assert breaker.allow()
+
+
+def test_breaker_failed_probe_reopens(clock):
+    breaker = CircuitBreaker("t", threshold=1, reset_timeout=10)
+    breaker.record_failure()
+    clock.now += 10
+    assert breaker.allow()
+    breaker.record_failure()
+
+    assert breaker.state == "open"
+    assert not breaker.allow()
+    clock.now += 10
+    assert breaker.allow()
+
+
+def test_breaker_gives_up_on_a_stale_probe(clock):
+    breaker = CircuitBreaker("t", threshold=1, reset_timeout=10)
+    breaker.record_failure()
+    clock.now += 10
+    assert breaker.allow()
+    clock.now += 10
+
+    assert breaker.allow()
+
+
+def test_breaker_call_ignores_non_failures(clock):
+    breaker = CircuitBreaker("t", threshold=1, reset_timeout=10, is_failure=is_transient_error)
+
+    def rejected():
+        raise StatusError(400)
+
+    with pytest.raises(StatusError):
+        breaker.call(rejected)
+    assert breaker.state == "closed"
+
+    def unavailable():
+        raise StatusError(503)
+
+    with pytest.raises(StatusError):
+        breaker.call(unavailable)
+    assert breaker.state == "open"
+    with pytest.raises(CircuitOpenError):
+        breaker.call(lambda: None)
+
+
+# ---- retry budget ----
+def test_budget_withdraws_whole_tokens_and_refills(clock):
+    budget = RetryBudget(ratio=0.5, min_per_sec=1.0, cap=2.0)
+    assert budget.withdraw() and budget.withdraw()
+    assert not budget.withdraw()
+
+    budget.deposit()
+    budget.deposit()
+    assert budget.withdraw()
+    assert not budget.withdraw()
+
+    clock.now += 1.5
+    assert budget.withdraw()
+    assert budget.tokens == pytest.approx(0.5)
+
+
+def test_budget_is_capped(clock):
+    budget = RetryBudget(ratio=1.0, min_per_sec=1.0, cap=2.0)
+    for _ in range(5):
+        budget.deposit()
+    clock.now += 60
+
+    assert budget.tokens == 2.0
+
+
+# ---- retry policy ----
+def flaky(errors):
+    calls = []
+
+    async def fn():
+        calls.append(1)
+        if errors:
+            raise errors.pop(0)
+        return "ok"
+
+    return fn, calls
+
+
+def no_sleep_policy(monkeypatch, **kwargs) -> RetryPolicy:
+    async def sleep(_):
+        return None
+
+    monkeypatch.setattr(retry.asyncio, "sleep", sleep)
+    return RetryPolicy(is_transient=is_transient_error, **kwargs)
+
+
+def test_policy_retries_transient_errors(monkeypatch):
+    policy = no_sleep_policy(monkeypatch, max_attempts=3)
+    fn, calls = flaky([StatusError(503), TimeoutError()])
+
+    assert asyncio.run(policy.run(fn)) == "ok"
+    assert len(calls) == 3
+    assert policy.counters["retries"] == 2
+
+
+def test_policy_does_not_retry_a_rejected_request(monkeypatch):
+    breaker = CircuitBreaker("t", threshold=1, reset_timeout=10, is_failure=is_transient_error)
+    policy = no_sleep_policy(monkeypatch, max_attempts=3, breaker=breaker)
+    fn, calls = flaky([StatusError(409)])
+
+    with pytest.raises(StatusError):
+        asyncio.run(policy.run(fn))
+    assert len(calls) == 1
+    assert policy.counters["non_retryable"] == 1
+    assert breaker.state == "closed"
+
+
+def test_policy_stops_when_the_budget_is_spent(monkeypatch, clock):
+    budget = RetryBudget(ratio=0.0, min_per_sec=0.0, cap=1.0)
+    policy = no_sleep_policy(monkeypatch, max_attempts=5, budget=budget)
+    fn, calls = flaky([StatusError(503)] * 4)
+
+    with pytest.raises(StatusError):
+        asyncio.run(policy.run(fn))
+    assert len(calls) == 2
+    assert policy.counters["budget_exhausted"] == 1
+
+
+def test_policy_fails_fast_once_the_breaker_opens(monkeypatch, clock):
+    breaker = CircuitBreaker("t", threshold=2, reset_timeout=10, is_failure=is_transient_error)
+    policy = no_sleep_policy(monkeypatch, max_attempts=5, breaker=breaker)
+    fn, calls = flaky([StatusError(503)] * 4)
+
+    with pytest.raises(CircuitOpenError):
+        asyncio.run(policy.run(fn))
+    assert len(calls) == 2
@@ -0,0 +1,61 @@
+import numpy as np
+import pytest
+
+from trends.sharding import merge_shards
+
+
+def ts(*hours):
+    return np.array([np.datetime64("2026-01-01T00:00:00") + np.timedelta64(h, "h") for h in hours], dtype="datetime64[s]")
+
+
+def test_shards_are_rescaled_through_the_anchor():
+    # The anchor reads 50 in shard one and 25 in shard two, so shard two is at half scale
+    one = (["anchor", "a"], ts(0, 1), np.array([[50.0, 100.0], [50.0, 20.0]]))
+    two = (["anchor", "b"], ts(0, 1), np.array([[25.0, 10.0], [25.0, 40.0]]))
+
+    grid, columns = merge_shards([one, two])
+
+    assert list(grid) == list(ts(0, 1))
+    np.testing.assert_allclose(columns["anchor"], [50.0, 50.0])
+    np.testing.assert_allclose(columns["a"], [100.0, 20.0])
+    np.testing.assert_allclose(columns["b"], [20.0, 80.0])
+
+
+def test_merged_values_are_renormalized_to_a_peak_of_100():
+    one = (["anchor", "a"], ts(0), np.array([[10.0, 20.0]]))
+    two = (["anchor", "b"], ts(0), np.array([[40.0, 100.0]]))
+
+    _, columns = merge_shards([one, two])
+
+    # Shard two is at 4x scale: b rescales to 25, the peak, which becomes 100
+    assert columns["b"][0] == pytest.approx(100.0)
+    assert columns["a"][0] == pytest.approx(80.0)
+    assert columns["anchor"][0] == pytest.approx(40.0)
+
+
+def test_anchor_factor_uses_only_timestamps_common_to_all_shards():
+    one = (["anchor", "a"], ts(0, 1, 2), np.array([[10.0, 10.0], [10.0, 10.0], [80.0, 10.0]]))
+    two = (["anchor", "b"], ts(0, 1), np.array([[20.0, 20.0], [20.0, 20.0]]))
+
+    grid, columns = merge_shards([one, two])
+
+    # Common window: hours 0 and 1, anchor totals 20 vs 40 -> shard two halves
+    assert len(grid) == 3
+    assert np.isnan(columns["b"][2])
+    assert columns["b"][0] == pytest.approx(columns["a"][0])
+
+
+def test_shard_without_anchor_interest_is_dropped():
+    one = (["anchor", "a"], ts(0), np.array([[50.0, 100.0]]))
+    dead = (["anchor", "b"], ts(0), np.array([[0.0, 30.0]]))
+
+    _, columns = merge_shards([one, dead])
+
+    assert columns["a"][0] == pytest.approx(100.0)
+    assert np.isnan(columns["b"][0])
+
+
+def test_empty_input():
+    grid, columns = merge_shards([(["anchor"], ts(), np.empty((0, 1)))])
+
+    assert len(grid) == 0 and columns == {}
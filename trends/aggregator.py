@@ -4,20 +4,32 @@ from typing import List, Dict, Any
 from functools import lru_cache
 import aiohttp
 
+from trends.shared import SharedTTLCache, shared_path
+
 # ========== CONFIG ==========
 CACHE_EXPIRY_SECONDS = 300  # 5 minutes
 THROTTLE_DELAY = 1.5  # seconds between calls to prevent rate-limiting
 
 # ========== CACHE ==========
+# Shared by all worker processes on the node when TRENDS_SHARED_DIR is set
+_shared_dir = shared_path("aggregator")
+_shared = SharedTTLCache(_shared_dir, CACHE_EXPIRY_SECONDS) if _shared_dir else None
 _cache: Dict[str, Dict[str, Any]] = {}
 
 def is_cache_valid(source: str) -> bool:
+    if _shared is not None:
+        return _shared.get(source)[0]
     return source in _cache and (time.time() - _cache[source]["timestamp"] < CACHE_EXPIRY_SECONDS)
 
 def get_cached(source: str) -> Any:
+    if _shared is not None:
+        return _shared.get(source)[1]
     return _cache[source]["data"]
 
 def set_cache(source: str, data: Any):
+    if _shared is not None:
+        _shared.set(source, data)
+        return
     _cache[source] = {"data": data, "timestamp": time.time()}
 
 # ========== ADAPTERS ==========
@@ -0,0 +1,126 @@
+"""
+Background refresh jobs for Blood API
+Runs trend refreshes off the request path. Only one refresh runs at a time:
+callers that arrive while one is in flight get attached to the same job.
+A run that finishes with warnings (e.g. some trend shards failed) is
+reported as "partial" rather than "succeeded".
+"""
+
+import logging
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+# Target signature: target(progress, warn) -> rows written, where progress(stage, fraction)
+# reports progress and warn(message) records a non-fatal failure
+ProgressCallback = Callable[[str, float], None]
+WarnCallback = Callable[[str], None]
+
+# ---------------------------
+# Job handle
+# ---------------------------
+class RefreshJob:
+    """State of one refresh run, updated by the worker thread and read by status calls."""
+
+    def __init__(self):
+        self.id: str = uuid.uuid4().hex
+        self.status: str = "queued"
+        self.stage: str = "queued"
+        self.progress: float = 0.0
+        self.rows_written: Optional[int] = None
+        self.error: Optional[str] = None
+        self.warnings: List[str] = []
+        self.attached: int = 0
+        self.created_at = datetime.utcnow()
+        self.started_at: Optional[datetime] = None
+        self.finished_at: Optional[datetime] = None
+        self._started = 0.0
+        self._duration: Optional[float] = None
+        self.done = threading.Event()
+
+    def update(self, stage: str, fraction: float) -> None:
+        self.stage = stage
+        self.progress = max(self.progress, min(1.0, fraction))
+
+    def warn(self, message: str) -> None:
+        self.warnings.append(message)
+
+    @property
+    def duration(self) -> Optional[float]:
+        if self._duration is not None:
+            return self._duration
+        if self.started_at:
+            return time.perf_counter() - self._started
+        return None
+
+    def to_dict(self) -> Dict[str, Any]:
+        duration = self.duration
+        return {
+            "job_id": self.id,
+            "status": self.status,
+            "stage": self.stage,
+            "progress": round(self.progress, 3),
+            "rows_written": self.rows_written,
+            "error": self.error,
+            "warnings": list(self.warnings),
+            "attached_requests": self.attached,
+            "created_at": self.created_at.isoformat(),
+            "started_at": self.started_at.isoformat() if self.started_at else None,
+            "finished_at": self.finished_at.isoformat() if self.finished_at else None,
+            "duration_s": round(duration, 3) if duration is not None else None,
+        }
+
+# ---------------------------
+# Single-flight manager
+# ---------------------------
+class RefreshJobManager:
+    """Starts `target` in a background thread unless a run is already in flight."""
+
+    def __init__(self, target: Callable[[ProgressCallback, WarnCallback], int], history: int = 20):
+        self.target = target
+        self.history = history
+        self._jobs: "OrderedDict[str, RefreshJob]" = OrderedDict()
+        self._current: Optional[RefreshJob] = None
+        self._lock = threading.Lock()
+
+    def submit(self) -> Tuple[RefreshJob, bool]:
+        """Return (job, created). created is False when attached to an in-flight run."""
+        with self._lock:
+            if self._current is not None and not self._current.done.is_set():
+                self._current.attached += 1
+                return self._current, False
+            job = RefreshJob()
+            self._current = job
+            self._jobs[job.id] = job
+            while len(self._jobs) > self.history:
+                self._jobs.popitem(last=False)
+        threading.Thread(target=self._run, args=(job,), name=f"refresh-{job.id[:8]}", daemon=True).start()
+        return job, True
+
+    def get(self, job_id: str) -> Optional[RefreshJob]:
+        return self._jobs.get(job_id)
+
+    @property
+    def current(self) -> Optional[RefreshJob]:
+        return self._current
+
+    def _run(self, job: RefreshJob) -> None:
+        job.status = "running"
+        job.started_at = datetime.utcnow()
+        job._started = time.perf_counter()
+        try:
+            job.rows_written = self.target(job.update, job.warn)
+            job.status = "partial" if job.warnings else "succeeded"
+            job.update("done", 1.0)
+        except Exception as e:
+            logging.error(f"❌ Refresh job {job.id} failed: {e}")
+            job.status = "failed"
+            job.error = str(e)
+        finally:
+            job._duration = time.perf_counter() - job._started
+            job.finished_at = datetime.utcnow()
+            job.done.set()
+            logging.info(f"🔁 Refresh job {job.id} {job.status} in {job._duration:.1f}s")
@@ -0,0 +1,190 @@
+"""
+Keyword sharding engine for Blood API
+pytrends.build_payload() takes at most 5 terms and scales them relative to each
+other, so large keyword sets are split into shards that all contain one shared
+anchor keyword. Shards are fetched on a rate-limited worker pool and rescaled
+onto a common 0–100 scale through the anchor before merging.
+"""
+
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+# ---------------------------
+# Configuration
+# ---------------------------
+DEFAULT_KEYWORDS: List[str] = ["python", "fastapi", "AI", "trending"]
+
+# Comma-separated keyword list; the anchor defaults to the first keyword
+TRENDS_KEYWORDS: List[str] = [
+    k.strip() for k in os.getenv("TRENDS_KEYWORDS", ",".join(DEFAULT_KEYWORDS)).split(",") if k.strip()
+]
+TRENDS_ANCHOR: Optional[str] = os.getenv("TRENDS_ANCHOR") or None
+TRENDS_TIMEFRAME: str = os.getenv("TRENDS_TIMEFRAME", "now 7-d")
+TRENDS_GEO: str = os.getenv("TRENDS_GEO", "US")
+
+# Throughput knobs: parallel payloads and payloads per second across the pool
+SHARD_WORKERS: int = int(os.getenv("TRENDS_SHARD_WORKERS", 2))
+SHARD_RATE: float = float(os.getenv("TRENDS_SHARD_RATE", 0.2))
+
+# pytrends hard limit per payload
+PAYLOAD_SIZE: int = 5
+
+ShardResult = Tuple[List[str], np.ndarray, np.ndarray]
+
+
+class ShardFetchError(RuntimeError):
+    """Raised by fetch_sharded() when every shard failed, so callers can tell it from "no data"."""
+
+# ---------------------------
+# Rate limiting
+# ---------------------------
+class RateLimiter:
+    """Thread-safe token bucket: `rate` acquisitions per second, bursts up to `burst`."""
+
+    def __init__(self, rate: float, burst: int = 1):
+        self.rate = rate
+        self.burst = burst
+        self._tokens = float(burst)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self) -> None:
+        if self.rate <= 0:
+            return
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+# ---------------------------
+# Sharding
+# ---------------------------
+def shard_keywords(keywords: Sequence[str], anchor: str) -> List[List[str]]:
+    """Split keywords into payloads of [anchor, up to 4 others]."""
+    others = [k for k in dict.fromkeys(keywords) if k != anchor]
+    step = PAYLOAD_SIZE - 1
+    if not others:
+        return [[anchor]]
+    return [[anchor] + others[i:i + step] for i in range(0, len(others), step)]
+
+
+def fetch_shard(shard: List[str], timeframe: str, geo: str, limiter: RateLimiter) -> ShardResult:
+    """Fetch one payload. Returns (keywords, datetime64 timestamps, values[T, len(shard)])."""
+    # pytrends pulls in pandas; only pay for it when a refresh actually runs
+    from pytrends.request import TrendReq
+
+    limiter.acquire()
+    pytrends = TrendReq(hl="en-US", tz=360)
+    pytrends.build_payload(kw_list=shard, timeframe=timeframe, geo=geo)
+    df = pytrends.interest_over_time()
+    if df.empty:
+        return shard, np.empty(0, dtype="datetime64[s]"), np.empty((0, len(shard)))
+    ts = df.index.values.astype("datetime64[s]")
+    values = df.reindex(columns=shard).to_numpy(dtype=np.float64, na_value=np.nan)
+    return shard, ts, values
+
+# ---------------------------
+# Vectorized merge
+# ---------------------------
+def merge_shards(results: List[ShardResult]) -> Tuple[np.ndarray, Dict[str, np.ndarray]]:
+    """
+    Rescale every shard onto a reference shard's scale via its anchor column (column 0),
+    then renormalize so the global maximum is 100.
+    """
+    results = [r for r in results if len(r[1])]
+    if not results:
+        return np.empty(0, dtype="datetime64[s]"), {}
+
+    grid = np.unique(np.concatenate([ts for _, ts, _ in results]))
+    # stacked[s, t, k]: shard s, grid timestamp t, payload slot k (NaN-padded)
+    stacked = np.full((len(results), len(grid), PAYLOAD_SIZE), np.nan)
+    for s, (_, ts, values) in enumerate(results):
+        stacked[s, np.searchsorted(grid, ts), :values.shape[1]] = values
+
+    anchors = stacked[:, :, 0]
+    common = ~np.isnan(anchors).any(axis=0)
+    if not common.any():
+        common = np.ones(len(grid), dtype=bool)
+    totals = np.nansum(anchors[:, common], axis=1)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        reference = totals[np.argmax(totals > 0)]
+        factors = np.where(totals > 0, reference / totals, np.nan)
+    for s in np.flatnonzero(np.isnan(factors)):
+        logging.warning(f"⚠️ Anchor has no interest in shard {results[s][0]}; dropping its values")
+
+    scaled = stacked * factors[:, None, None]
+    peak = np.nanmax(scaled) if np.isfinite(scaled).any() else 0
+    if peak > 0:
+        scaled *= 100.0 / peak
+
+    columns: Dict[str, np.ndarray] = {}
+    for s, (shard, _, _) in enumerate(results):
+        for k, keyword in enumerate(shard):
+            if keyword not in columns:
+                columns[keyword] = scaled[s, :, k]
+    return grid, columns
+
+# ---------------------------
+# Entry point
+# ---------------------------
+def fetch_sharded(
+    keywords: Sequence[str] = None,
+    anchor: Optional[str] = None,
+    timeframe: str = TRENDS_TIMEFRAME,
+    geo: str = TRENDS_GEO,
+    workers: int = SHARD_WORKERS,
+    rate: float = SHARD_RATE,
+    on_shard: Optional[Callable[[int, int], None]] = None,
+    on_shard_error: Optional[Callable[[List[str], Exception], None]] = None,
+) -> Tuple[List[str], Dict[str, List[float]]]:
+    """
+    Fetch interest over time for any number of keywords on a common scale.
+    Returns ISO timestamps and one interest column per keyword (NaN where missing);
+    keywords whose shard failed are left out and reported to `on_shard_error(shard, error)`.
+    Raises ShardFetchError when every shard failed. `on_shard(done, total)` is called as
+    shards finish.
+    """
+    keywords = list(keywords or TRENDS_KEYWORDS)
+    anchor = anchor or TRENDS_ANCHOR or keywords[0]
+    shards = shard_keywords(keywords, anchor)
+    limiter = RateLimiter(rate)
+    logging.info(f"🧩 Fetching {len(keywords)} keywords in {len(shards)} shards (anchor='{anchor}')")
+
+    results: List[ShardResult] = []
+    failures: List[Tuple[List[str], Exception]] = []
+    with ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="trends-shard") as pool:
+        futures = {pool.submit(fetch_shard, shard, timeframe, geo, limiter): shard for shard in shards}
+        for finished, future in enumerate(as_completed(futures), 1):
+            try:
+                results.append(future.result())
+            except Exception as e:
+                logging.error(f"❌ Shard {futures[future]} failed: {e}")
+                failures.append((futures[future], e))
+                if on_shard_error:
+                    on_shard_error(futures[future], e)
+            if on_shard:
+                on_shard(finished, len(shards))
+
+    if len(failures) == len(shards):
+        raise ShardFetchError(f"All {len(shards)} trend shards failed (first error: {failures[0][1]})")
+
+    # Keep shard order stable so the merge is deterministic
+    order = {tuple(shard): i for i, shard in enumerate(shards)}
+    results.sort(key=lambda r: order[tuple(r[0])])
+    grid, columns = merge_shards(results)
+    timestamps = np.datetime_as_string(grid, unit="s").tolist()
+    return timestamps, {
+        k: columns[k].tolist() for k in keywords if k in columns and np.isfinite(columns[k]).any()
+    }
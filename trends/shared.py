@@ -0,0 +1,153 @@
+"""
+Cross-process trend cache for Blood API
+Lets every uvicorn/gunicorn worker on a node share one copy of the trend data,
+so a single refresh (normally on the scheduler leader) serves all of them.
+
+  * SnapshotFile: the TrendSeriesStore snapshot as one flat file (timestamps +
+    a keyword x points float32 matrix). Readers mmap it, so the pages are shared
+    by every process; writers build a temp file and os.replace() it into place,
+    which swaps snapshots atomically while old mappings stay valid.
+  * SharedTTLCache: small JSON values (e.g. aggregator results) as one file per
+    key with the same write-then-rename swap.
+
+Files live under TRENDS_SHARED_DIR (tmpfs /dev/shm when available). Set it to
+an empty string to keep caches per-process.
+"""
+
+import json
+import mmap
+import os
+import struct
+import tempfile
+import time
+from typing import Any, Dict, Optional, Tuple
+
+import numpy as np
+
+# ---------------------------
+# Configuration
+# ---------------------------
+_DEFAULT_DIR = os.path.join("/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir(), "blood-trends")
+TRENDS_SHARED_DIR: str = os.getenv("TRENDS_SHARED_DIR", _DEFAULT_DIR)
+# How often a reader stats the snapshot file for a newer version (seconds)
+TRENDS_SHARED_CHECK_INTERVAL: float = float(os.getenv("TRENDS_SHARED_CHECK_INTERVAL", 1.0))
+
+MAGIC = b"BLDTS001"
+HEADER_LEN = struct.Struct("<I")
+
+
+def _atomic_write(path: str, write) -> None:
+    """Write via a temp file in the same directory, then rename over `path`."""
+    directory = os.path.dirname(path) or "."
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=directory, prefix=".tmp-")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            write(f)
+        os.replace(tmp, path)
+    except BaseException:
+        try:
+            os.remove(tmp)
+        except FileNotFoundError:
+            pass
+        raise
+
+# ---------------------------
+# Trend snapshot file
+# ---------------------------
+class SnapshotFile:
+    """Memory-mapped (timestamps, {keyword: values}) snapshot shared across processes."""
+
+    def __init__(self, path: str, check_interval: float = TRENDS_SHARED_CHECK_INTERVAL):
+        self.path = path
+        self.check_interval = check_interval
+        self._version: Optional[Tuple[int, int]] = None
+        self._next_check = 0.0
+
+    def publish(self, ts: np.ndarray, cols: Dict[str, np.ndarray]) -> None:
+        keywords = sorted(cols)
+        header = json.dumps({"keywords": keywords, "points": int(len(ts))}).encode()
+        # Pad the header so the arrays start 8-byte aligned
+        header += b" " * (-(len(MAGIC) + HEADER_LEN.size + len(header)) % 8)
+
+        def write(f):
+            f.write(MAGIC)
+            f.write(HEADER_LEN.pack(len(header)))
+            f.write(header)
+            f.write(np.ascontiguousarray(ts, dtype="datetime64[s]").tobytes())
+            for keyword in keywords:
+                f.write(np.ascontiguousarray(cols[keyword], dtype=np.float32).tobytes())
+
+        _atomic_write(self.path, write)
+        self._version = self._stat()
+
+    def _stat(self) -> Optional[Tuple[int, int]]:
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+        return st.st_ino, st.st_mtime_ns
+
+    def poll(self, force: bool = False) -> Optional[Tuple[np.ndarray, Dict[str, np.ndarray]]]:
+        """Return a newer published snapshot than the last one seen, else None (rate-limited stat)."""
+        now = time.monotonic()
+        if now < self._next_check and not force:
+            return None
+        self._next_check = now + self.check_interval
+        version = self._stat()
+        if version is None or version == self._version:
+            return None
+        snapshot = self.load()
+        self._version = version
+        return snapshot
+
+    def load(self) -> Optional[Tuple[np.ndarray, Dict[str, np.ndarray]]]:
+        try:
+            with open(self.path, "rb") as f:
+                mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except (FileNotFoundError, ValueError):
+            return None
+        if mm[:len(MAGIC)] != MAGIC:
+            return None
+        (header_len,) = HEADER_LEN.unpack_from(mm, len(MAGIC))
+        offset = len(MAGIC) + HEADER_LEN.size
+        header = json.loads(mm[offset:offset + header_len])
+        offset += header_len
+        n, keywords = header["points"], header["keywords"]
+        # Read-only views over the mapping: no copy, pages shared with other workers
+        ts = np.frombuffer(mm, dtype="datetime64[s]", count=n, offset=offset)
+        matrix = np.frombuffer(mm, dtype=np.float32, count=n * len(keywords), offset=offset + n * 8)
+        matrix = matrix.reshape(len(keywords), n)
+        return ts, {keyword: matrix[i] for i, keyword in enumerate(keywords)}
+
+# ---------------------------
+# Small shared TTL cache
+# ---------------------------
+class SharedTTLCache:
+    """JSON values with a TTL, one file per key, visible to every worker on the node."""
+
+    def __init__(self, directory: str, ttl: float):
+        self.directory = directory
+        self.ttl = ttl
+
+    def _path(self, key: str) -> str:
+        safe = "".join(c if c.isalnum() or c in "-_" else "_" for c in key)
+        return os.path.join(self.directory, f"{safe}.json")
+
+    def get(self, key: str) -> Tuple[bool, Any]:
+        """(fresh, value); value is None when the key was never cached."""
+        try:
+            with open(self._path(key)) as f:
+                entry = json.load(f)
+        except (FileNotFoundError, ValueError):
+            return False, None
+        return time.time() - entry["timestamp"] < self.ttl, entry["data"]
+
+    def set(self, key: str, data: Any) -> None:
+        payload = json.dumps({"timestamp": time.time(), "data": data}, default=str).encode()
+        _atomic_write(self._path(key), lambda f: f.write(payload))
+
+
+def shared_path(*parts: str) -> Optional[str]:
+    """Path under TRENDS_SHARED_DIR, or None when sharing is disabled."""
+    return os.path.join(TRENDS_SHARED_DIR, *parts) if TRENDS_SHARED_DIR else None
@@ -0,0 +1,179 @@
+"""
+Columnar trend time-series store for Blood API
+Holds one NumPy timestamp array plus one interest array per keyword, so
+/daily-trends and /trends/{keyword} are served from memory instead of Supabase.
+With a shared SnapshotFile, every write is published for the other worker
+processes on the node and reads pick up their newer snapshots.
+"""
+
+import logging
+import os
+import threading
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from trends.shared import SnapshotFile, shared_path
+
+# ---------------------------
+# Configuration
+# ---------------------------
+# Points kept per keyword (hourly samples; default ≈ 30 days)
+STORE_MAX_POINTS: int = int(os.getenv("TRENDS_STORE_MAX_POINTS", 720))
+
+TS_DTYPE = "datetime64[s]"
+VALUE_DTYPE = np.float32
+
+Snapshot = Tuple[np.ndarray, Dict[str, np.ndarray]]
+
+
+def to_datetime64(value) -> Optional[np.datetime64]:
+    """
+    Parse an ISO string or datetime (or None) into a second-resolution UTC datetime64.
+    Offset-aware values are converted to UTC; naive ones are taken as UTC already.
+    """
+    if value is None:
+        return None
+    dt = value if isinstance(value, datetime) else datetime.fromisoformat(str(value).replace("Z", "+00:00"))
+    if dt.tzinfo is not None:
+        dt = dt.astimezone(timezone.utc).replace(tzinfo=None)
+    return np.datetime64(dt, "s")
+
+
+def _points(ts: np.ndarray, values: np.ndarray) -> List[Dict[str, Any]]:
+    stamps = np.datetime_as_string(ts, unit="s").tolist()
+    return [
+        {"fetched_at": stamp, "interest": None if np.isnan(v) else round(float(v), 2)}
+        for stamp, v in zip(stamps, values)
+    ]
+
+# ---------------------------
+# Store
+# ---------------------------
+class TrendSeriesStore:
+    """
+    Immutable snapshots of (timestamps, {keyword: interest}) swapped atomically.
+    Readers never lock; writers build a new snapshot and replace the reference.
+    """
+
+    def __init__(self, max_points: int = STORE_MAX_POINTS, shared: Optional[SnapshotFile] = None):
+        self.max_points = max_points
+        self.shared = shared
+        self._snapshot: Snapshot = (np.empty(0, dtype=TS_DTYPE), {})
+        self._lock = threading.Lock()
+
+    def _current(self, force: bool = False) -> Snapshot:
+        """Local snapshot, swapped for a newer one another worker published, if any."""
+        if self.shared is not None:
+            published = self.shared.poll(force=force)
+            if published is not None:
+                self._snapshot = published
+        return self._snapshot
+
+    def _swap(self, snapshot: Snapshot) -> None:
+        self._snapshot = snapshot
+        if self.shared is not None:
+            try:
+                self.shared.publish(*snapshot)
+            except OSError as e:
+                logging.warning(f"⚠️ Could not publish shared trend snapshot: {e}")
+
+    # ---- writes ----
+    def replace(self, timestamps: Sequence[str], columns: Dict[str, Sequence[float]]) -> None:
+        """Swap in a fresh snapshot built from ISO timestamps and per-keyword columns."""
+        ts = np.asarray(timestamps, dtype=TS_DTYPE)
+        order = np.argsort(ts, kind="stable")
+        cols = {k: np.asarray(v, dtype=VALUE_DTYPE)[order] for k, v in columns.items()}
+        with self._lock:
+            self._swap(self._trim(ts[order], cols))
+
+    def merge(self, timestamps: Sequence[str], columns: Dict[str, Sequence[float]]) -> None:
+        """Union new points into the current snapshot; new values win on overlap."""
+        new_ts = np.asarray(timestamps, dtype=TS_DTYPE)
+        with self._lock:
+            old_ts, old_cols = self._current(force=True)
+            ts = np.union1d(old_ts, new_ts)
+            old_idx = np.searchsorted(ts, old_ts)
+            new_idx = np.searchsorted(ts, new_ts)
+            cols: Dict[str, np.ndarray] = {}
+            for keyword in set(old_cols) | set(columns):
+                merged = np.full(ts.shape, np.nan, dtype=VALUE_DTYPE)
+                if keyword in old_cols:
+                    merged[old_idx] = old_cols[keyword]
+                if keyword in columns:
+                    merged[new_idx] = np.asarray(columns[keyword], dtype=VALUE_DTYPE)
+                cols[keyword] = merged
+            self._swap(self._trim(ts, cols))
+
+    def _trim(self, ts: np.ndarray, cols: Dict[str, np.ndarray]) -> Snapshot:
+        if self.max_points and len(ts) > self.max_points:
+            ts = ts[-self.max_points:]
+            cols = {k: v[-self.max_points:] for k, v in cols.items()}
+        return ts, cols
+
+    # ---- reads ----
+    def __len__(self) -> int:
+        return len(self._current()[0])
+
+    def keywords(self) -> List[str]:
+        return sorted(self._current()[1])
+
+    def snapshot(self) -> Snapshot:
+        return self._current()
+
+    def range(
+        self,
+        start: Optional[str] = None,
+        end: Optional[str] = None,
+        keywords: Optional[Sequence[str]] = None,
+    ) -> Snapshot:
+        """Slice [start, end] (inclusive ISO bounds) for the given keywords (default: all)."""
+        ts, cols = self._current()
+        lo = 0 if start is None else int(np.searchsorted(ts, to_datetime64(start), side="left"))
+        hi = len(ts) if end is None else int(np.searchsorted(ts, to_datetime64(end), side="right"))
+        selected = cols if keywords is None else {k: cols[k] for k in keywords if k in cols}
+        return ts[lo:hi], {k: v[lo:hi] for k, v in selected.items()}
+
+    def latest(self, n: int, keywords: Optional[Sequence[str]] = None) -> Snapshot:
+        """Last `n` timestamps for the given keywords (default: all)."""
+        ts, cols = self._current()
+        lo = max(0, len(ts) - n)
+        selected = cols if keywords is None else {k: cols[k] for k in keywords if k in cols}
+        return ts[lo:], {k: v[lo:] for k, v in selected.items()}
+
+    def series(
+        self,
+        keyword: str,
+        start: Optional[str] = None,
+        end: Optional[str] = None,
+        limit: Optional[int] = None,
+    ) -> Optional[List[Dict[str, Any]]]:
+        """Points for one keyword, or None if the keyword is unknown."""
+        if keyword not in self._current()[1]:
+            return None
+        ts, cols = self.range(start, end, [keyword])
+        values = cols[keyword]
+        if limit is not None:
+            lo = max(0, len(ts) - limit)
+            ts, values = ts[lo:], values[lo:]
+        return _points(ts, values)
+
+    def latest_rows(self, limit: int = 10) -> List[Dict[str, Any]]:
+        """Newest (keyword, interest, fetched_at) rows across keywords, newest first."""
+        ts, cols = self._current()
+        rows: List[Dict[str, Any]] = []
+        for i in range(len(ts) - 1, -1, -1):
+            stamp = str(np.datetime_as_string(ts[i], unit="s"))
+            for keyword in sorted(cols):
+                value = cols[keyword][i]
+                if np.isnan(value):
+                    continue
+                rows.append({"keyword": keyword, "interest": round(float(value), 2), "fetched_at": stamp})
+                if len(rows) >= limit:
+                    return rows
+        return rows
+
+
+_shared_snapshot = shared_path("trend_series.bin")
+trend_store = TrendSeriesStore(shared=SnapshotFile(_shared_snapshot) if _shared_snapshot else None)
@@ -0,0 +1,117 @@
+"""
+Trend ingestion watermarks for Blood API
+Keeps a per-keyword high-water mark for `fetched_at` so each scheduled refresh
+only writes timestamps it has not stored yet. Marks are persisted to a local JSON
+file and mirrored to the `trend_watermarks` table in Supabase.
+"""
+
+import json
+import logging
+import os
+import threading
+from bisect import bisect_left
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Optional, Sequence
+
+from utils.supabase_client import supabase, upsert
+
+# ---------------------------
+# Configuration
+# ---------------------------
+WATERMARK_FILE: str = os.getenv("TRENDS_WATERMARK_FILE", "trend_watermarks.json")
+WATERMARK_TABLE: str = "trend_watermarks"
+
+# Points newer than (watermark - overlap) are re-sent as idempotent upserts, so
+# Google's partial trailing samples get corrected on the next run.
+WATERMARK_OVERLAP_HOURS: float = float(os.getenv("TRENDS_WATERMARK_OVERLAP_HOURS", 2))
+
+
+def _parse(ts: str) -> datetime:
+    """Parse an ISO timestamp into a naive UTC datetime."""
+    dt = datetime.fromisoformat(ts.replace("Z", "+00:00"))
+    if dt.tzinfo is not None:
+        dt = dt.astimezone(timezone.utc).replace(tzinfo=None)
+    return dt
+
+# ---------------------------
+# Watermark store
+# ---------------------------
+class WatermarkStore:
+    """Per-keyword high-water marks, persisted locally and in Supabase."""
+
+    def __init__(self, path: str = WATERMARK_FILE, client=None, overlap_hours: float = WATERMARK_OVERLAP_HOURS):
+        self.path = path
+        self.client = client or supabase
+        self.overlap = timedelta(hours=overlap_hours)
+        self._marks: Dict[str, datetime] = {}
+        self._loaded = False
+        self._lock = threading.Lock()
+
+    def _load(self) -> None:
+        """Merge the local file and the Supabase table, keeping the newest mark per keyword."""
+        marks: Dict[str, datetime] = {}
+        if os.path.exists(self.path):
+            try:
+                with open(self.path) as f:
+                    marks = {k: _parse(v) for k, v in json.load(f).items()}
+            except (OSError, ValueError) as e:
+                logging.warning(f"⚠️ Could not read {self.path}: {e}")
+        try:
+            result = self.client.table(WATERMARK_TABLE).select("keyword,fetched_at").execute()
+            for row in result.data or []:
+                remote = _parse(row["fetched_at"])
+                if row["keyword"] not in marks or remote > marks[row["keyword"]]:
+                    marks[row["keyword"]] = remote
+        except Exception as e:
+            logging.warning(f"⚠️ Could not load trend watermarks from Supabase: {e}")
+        self._marks = marks
+        self._loaded = True
+
+    def get(self, keyword: str) -> Optional[datetime]:
+        with self._lock:
+            if not self._loaded:
+                self._load()
+            return self._marks.get(keyword)
+
+    def start_offsets(self, timestamps: Sequence[str], keywords: Sequence[str]) -> Dict[str, int]:
+        """
+        Return, per keyword, the index of the first timestamp that still has to be written.
+        `timestamps` must be sorted ascending (as returned by interest_over_time()).
+        """
+        parsed = [_parse(ts) for ts in timestamps]
+        offsets: Dict[str, int] = {}
+        for keyword in keywords:
+            mark = self.get(keyword)
+            offsets[keyword] = 0 if mark is None else bisect_left(parsed, mark - self.overlap)
+        return offsets
+
+    def advance(self, timestamps: Sequence[str], keywords: Sequence[str]) -> None:
+        """Move every keyword's mark up to the newest timestamp just written."""
+        if not timestamps:
+            return
+        newest = _parse(timestamps[-1])
+        with self._lock:
+            if not self._loaded:
+                self._load()
+            changed = {k: newest for k in keywords if k not in self._marks or self._marks[k] < newest}
+            if not changed:
+                return
+            self._marks.update(changed)
+            self._save_local()
+        self._save_remote(changed)
+
+    def _save_local(self) -> None:
+        tmp = f"{self.path}.tmp"
+        with open(tmp, "w") as f:
+            json.dump({k: v.isoformat() for k, v in self._marks.items()}, f, indent=2)
+        os.replace(tmp, self.path)
+
+    def _save_remote(self, changed: Dict[str, datetime]) -> None:
+        rows = [{"keyword": k, "fetched_at": v.isoformat()} for k, v in changed.items()]
+        try:
+            upsert(WATERMARK_TABLE, rows, on_conflict="keyword", client=self.client)
+        except Exception as e:
+            logging.warning(f"⚠️ Could not persist trend watermarks to Supabase: {e}")
+
+
+watermarks = WatermarkStore()
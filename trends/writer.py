@@ -0,0 +1,84 @@
+"""
+Bulk trend writer for Blood API
+Expands per-keyword column arrays (see trends.sharding) into rows and upserts them
+into Supabase in chunks keyed on (keyword, fetched_at), instead of one insert per cell.
+"""
+
+import logging
+import math
+import os
+from typing import Any, Dict, List, Optional, Sequence
+
+from utils.supabase_client import supabase, upsert
+
+# ---------------------------
+# Configuration
+# ---------------------------
+TRENDS_TABLE: str = "trends"
+
+# Rows sent per upsert request (configurable via env)
+UPSERT_CHUNK_SIZE: int = int(os.getenv("TRENDS_UPSERT_CHUNK_SIZE", 500))
+
+# Unique key the upsert resolves conflicts on (see supabase/migrations)
+ON_CONFLICT: str = "keyword,fetched_at"
+
+Columns = Dict[str, List[float]]
+
+# ---------------------------
+# Row building
+# ---------------------------
+def build_rows(
+    timestamps: Sequence[str],
+    columns: Columns,
+    start: Optional[Dict[str, int]] = None,
+) -> List[Dict[str, Any]]:
+    """
+    Expand column arrays into the row payload expected by the trends table, skipping NaN gaps.
+    `start` optionally maps a keyword to the first index to emit (see trends.watermarks).
+    """
+    start = start or {}
+    rows: List[Dict[str, Any]] = []
+    for keyword, values in columns.items():
+        offset = start.get(keyword, 0)
+        rows.extend(
+            {"keyword": keyword, "interest": round(float(value), 2), "fetched_at": ts}
+            for ts, value in zip(timestamps[offset:], values[offset:])
+            if not math.isnan(value)
+        )
+    return rows
+
+# ---------------------------
+# Upsert
+# ---------------------------
+def upsert_rows(rows: List[Dict[str, Any]], chunk_size: int = None, client=None) -> int:
+    """
+    Upsert rows into the trends table in chunks and return how many were written.
+    """
+    from postgrest.types import ReturnMethod
+
+    client = client or supabase
+    chunk_size = max(1, chunk_size or UPSERT_CHUNK_SIZE)
+    written = 0
+    for start in range(0, len(rows), chunk_size):
+        chunk = rows[start:start + chunk_size]
+        upsert(TRENDS_TABLE, chunk, on_conflict=ON_CONFLICT, client=client, returning=ReturnMethod.minimal)
+        written += len(chunk)
+    return written
+
+
+def write_trends(
+    timestamps: Sequence[str],
+    columns: Columns,
+    start: Optional[Dict[str, int]] = None,
+    chunk_size: int = None,
+    client=None,
+) -> int:
+    """
+    Build rows from column arrays and upsert them. Returns the number of rows written.
+    """
+    rows = build_rows(timestamps, columns, start=start)
+    if not rows:
+        return 0
+    written = upsert_rows(rows, chunk_size=chunk_size, client=client)
+    logging.info(f"📦 Upserted {written} trend rows in chunks of {chunk_size or UPSERT_CHUNK_SIZE}")
+    return written
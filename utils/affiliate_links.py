@@ -1,82 +1,178 @@
+import asyncio
 import logging
+import os
+import threading
 import time
+from collections import OrderedDict
 from datetime import datetime
-from .supabase_client import supabase
+from typing import Any, Dict, Optional, Tuple
 
-def get_affiliate_link(
-    link_id: str,
-    fallback_url: str = None,
-    utm_source: str = "autoloop",
-    utm_medium: str = "affiliate",
-    utm_campaign: str = "default_campaign"
-) -> str:
+from .supabase_client import supabase, supabase_db
+from .utm import build_utm_url
+from .retry import supabase_breaker
+
+LINKS_TABLE = "affiliate_links"
+LINK_CACHE_TTL = float(os.getenv("LINK_CACHE_TTL", 600))
+LINK_CACHE_NEGATIVE_TTL = float(os.getenv("LINK_CACHE_NEGATIVE_TTL", 60))
+LINK_CACHE_MAX_ENTRIES = int(os.getenv("LINK_CACHE_MAX_ENTRIES", 10000))
+LINK_CACHE_REFRESH_INTERVAL = float(os.getenv("LINK_CACHE_REFRESH_INTERVAL", 300))
+
+
+class LinkCache:
     """
-    Fetch the affiliate link from Supabase, inject UTM params, log click, or return fallback.
+    In-process link_id -> url cache with LRU + TTL eviction and negative entries
+    (url=None) for ids that do not exist. Preloaded with one bulk select.
     """
-    if not link_id:
-        logging.info("No link_id provided, returning fallback URL.")
-        return fallback_url
 
-    try:
-        # Fetch the affiliate URL from Supabase
-        response = (
-            supabase.table("affiliate_links")
-            .select("url")
-            .eq("link_id", link_id)
-            .single()
-            .execute()
+    def __init__(
+        self,
+        ttl: float = LINK_CACHE_TTL,
+        negative_ttl: float = LINK_CACHE_NEGATIVE_TTL,
+        max_entries: int = LINK_CACHE_MAX_ENTRIES,
+    ):
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, Tuple[float, Optional[str]]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._task: Optional[asyncio.Task] = None
+        self.counters: Dict[str, int] = {"hits": 0, "negative_hits": 0, "misses": 0, "preloads": 0}
+        self.last_preload: Optional[datetime] = None
+
+    def get(self, link_id: str) -> Tuple[bool, Optional[str]]:
+        """Return (cached, url). url is None for a cached "not found"."""
+        with self._lock:
+            entry = self._entries.get(link_id)
+            if entry is None or entry[0] < time.monotonic():
+                if entry is not None:
+                    del self._entries[link_id]
+                self.counters["misses"] += 1
+                return False, None
+            self._entries.move_to_end(link_id)
+            self.counters["hits" if entry[1] is not None else "negative_hits"] += 1
+            return True, entry[1]
+
+    def put(self, link_id: str, url: Optional[str]) -> None:
+        ttl = self.ttl if url is not None else self.negative_ttl
+        with self._lock:
+            self._entries[link_id] = (time.monotonic() + ttl, url)
+            self._entries.move_to_end(link_id)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, link_id: Optional[str] = None) -> None:
+        with self._lock:
+            if link_id is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(link_id, None)
+
+    def preload(self) -> int:
+        """Load the whole link table in bulk (paged past PostgREST's row cap) and swap it in."""
+        rows = []
+        while True:
+            page = (
+                supabase.table(LINKS_TABLE)
+                .select("link_id,url")
+                .order("link_id")  # offset paging needs a stable order
+                .range(len(rows), len(rows) + 999)
+                .execute()
+            )
+            rows.extend(page.data or [])
+            if len(page.data or []) < 1000:
+                break
+        expires = time.monotonic() + self.ttl
+        fresh: "OrderedDict[str, Tuple[float, Optional[str]]]" = OrderedDict(
+            (row["link_id"], (expires, row["url"])) for row in rows if row.get("url")
         )
-        data = response.data
+        with self._lock:
+            self._entries = fresh
+        self.counters["preloads"] += 1
+        self.last_preload = datetime.utcnow()
+        logging.info(f"🔗 Preloaded {len(fresh)} affiliate links")
+        return len(fresh)
 
-        if data and "url" in data:
-            url = data["url"]
-        else:
-            logging.info(f"Affiliate link not found for link_id={link_id}, using fallback.")
-            url = fallback_url
+    async def _refresh_loop(self, interval: float) -> None:
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await supabase_db.run(self.preload)
+            except Exception as e:
+                logging.warning(f"⚠️ Affiliate link refresh failed, keeping cached links: {e}")
 
-        if not url:
-            return fallback_url
+    async def start(self, interval: float = LINK_CACHE_REFRESH_INTERVAL) -> None:
+        """Preload now and keep refreshing in the background."""
+        try:
+            await supabase_db.run(self.preload)
+        except Exception as e:
+            logging.warning(f"⚠️ Affiliate link preload failed, falling back to lazy lookups: {e}")
+        if self._task is None:
+            self._task = asyncio.get_event_loop().create_task(self._refresh_loop(interval))
 
-        # Add UTM parameters
-        separator = "&" if "?" in url else "?"
-        url = f"{url}{separator}utm_source={utm_source}&utm_medium={utm_medium}&utm_campaign={utm_campaign}"
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
 
-        # Log the click
-        log_click(link_id, utm_source=utm_source, utm_medium=utm_medium, utm_campaign=utm_campaign)
+    def stats(self) -> Dict[str, Any]:
+        return {
+            **self.counters,
+            "entries": len(self._entries),
+            "last_preload": self.last_preload.isoformat() if self.last_preload else None,
+        }
 
-        return url
 
-    except Exception as e:
-        logging.error(f"Error fetching affiliate link for link_id={link_id}: {e}")
-        return fallback_url
+link_cache = LinkCache()
 
 
-def log_click(
+def resolve_link(link_id: str) -> Optional[str]:
+    """Return the stored URL for link_id (cache first), or None if it does not exist."""
+    cached, url = link_cache.get(link_id)
+    if cached:
+        return url
+    # Raises CircuitOpenError right away while Supabase is known to be down
+    response = supabase_breaker.call(
+        supabase.table(LINKS_TABLE)
+        .select("url")
+        .eq("link_id", link_id)
+        .limit(1)
+        .execute
+    )
+    rows = response.data or []
+    url = rows[0].get("url") if rows else None
+    link_cache.put(link_id, url or None)
+    return url or None
+
+
+def get_affiliate_link(
     link_id: str,
+    fallback_url: str = None,
     utm_source: str = "autoloop",
     utm_medium: str = "affiliate",
-    utm_campaign: str = "default_campaign",
-    max_retries: int = 3,
-    delay: float = 1.0
-) -> bool:
+    utm_campaign: str = "default_campaign"
+) -> str:
     """
-    Logs a click to Supabase with retry on failure, including UTM info.
+    Resolve the affiliate link (cached) and inject UTM params. The fallback URL
+    (tagged the same way) is used when link_id is missing, unknown or the lookup fails.
     """
-    for attempt in range(max_retries):
+    url = None
+    if not link_id:
+        logging.info("No link_id provided, using fallback URL.")
+    else:
         try:
-            supabase.table("affiliate_clicks").insert({
-                "link_id": link_id,
-                "clicked_at": datetime.utcnow().isoformat(),
-                "utm_source": utm_source,
-                "utm_medium": utm_medium,
-                "utm_campaign": utm_campaign
-            }).execute()
-            logging.info(f"Click logged for link_id={link_id}")
-            return True
+            # Resolve the affiliate URL (in-process cache, Supabase on miss)
+            url = resolve_link(link_id)
+            if not url:
+                logging.info(f"Affiliate link not found for link_id={link_id}, using fallback.")
         except Exception as e:
-            logging.error(f"Error logging click for link_id={link_id}: {e}")
-            if attempt < max_retries - 1:
-                time.sleep(delay)
-            else:
-                logging.warning(f"Failed to log click after {max_retries} attempts")
-    return False
+            # Not cached: the next request tries the lookup again
+            logging.error(f"Error fetching affiliate link for link_id={link_id}: {e}")
+
+    url = url or fallback_url
+    if not url:
+        return fallback_url
+
+    # Add UTM parameters (memoized, encoded template). Clicks are recorded
+    # once by the caller through utils.click_pipeline, not here.
+    return build_utm_url(url, utm_source, utm_medium, utm_campaign)
+
@@ -0,0 +1,75 @@
+"""
+Streaming chat relay for Blood API
+Relays Ollama's incremental tokens to the client as server-sent events or
+chunked NDJSON. Leaving the upstream stream early (client disconnect or
+cancellation) closes the connection, which stops Ollama's generation.
+"""
+
+import json
+import logging
+from typing import Any, AsyncIterator, Dict, Optional
+
+import httpx
+from fastapi import Request
+
+MEDIA_TYPES: Dict[str, str] = {
+    "sse": "text/event-stream",
+    "ndjson": "application/x-ndjson",
+}
+
+
+def _extract_token(line: str) -> Optional[Dict[str, Any]]:
+    """
+    Parse one upstream line. Understands Ollama's native NDJSON chunks and
+    OpenAI-style `data: {...}` SSE chunks. Returns {"token", "done"} or None.
+    """
+    line = line.strip()
+    if not line:
+        return None
+    if line.startswith("data:"):
+        line = line[len("data:"):].strip()
+        if line == "[DONE]":
+            return {"token": "", "done": True}
+    chunk = json.loads(line)
+    if "message" in chunk:
+        token = (chunk.get("message") or {}).get("content", "")
+    elif "choices" in chunk:
+        token = ((chunk["choices"] or [{}])[0].get("delta") or {}).get("content") or ""
+    else:
+        token = chunk.get("response", "")
+    return {"token": token, "done": bool(chunk.get("done"))}
+
+
+def _frame(event: Dict[str, Any], fmt: str) -> bytes:
+    payload = json.dumps(event)
+    if fmt == "sse":
+        return f"data: {payload}\n\n".encode()
+    return f"{payload}\n".encode()
+
+
+async def stream_chat(
+    client: httpx.AsyncClient,
+    url: str,
+    payload: Dict[str, Any],
+    request: Request,
+    fmt: str = "sse",
+) -> AsyncIterator[bytes]:
+    """Yield framed token events from Ollama until done or the client goes away."""
+    try:
+        async with client.stream("POST", url, json={**payload, "stream": True}) as resp:
+            if resp.status_code != 200:
+                yield _frame({"error": f"Upstream returned {resp.status_code}", "done": True}, fmt)
+                return
+            async for line in resp.aiter_lines():
+                if await request.is_disconnected():
+                    logging.info("🔌 Chat client disconnected, cancelling upstream generation")
+                    return
+                event = _extract_token(line)
+                if event is None:
+                    continue
+                yield _frame(event, fmt)
+                if event["done"]:
+                    return
+    except (httpx.HTTPError, ValueError) as e:
+        logging.error(f"❌ Chat stream failed: {e}")
+        yield _frame({"error": str(e), "done": True}, fmt)
@@ -0,0 +1,304 @@
+"""
+Click ingestion pipeline for Blood API
+Redirect handlers drop click events into a bounded in-memory buffer; a
+background task flushes them to `affiliate_clicks` in batches (by size or
+time). Batches that cannot be written spill to a local write-ahead file and
+are replayed once Supabase is reachable again. Writes go through the shared
+Supabase retry policy; while its circuit is open batches spill immediately.
+Clicks that overflow a full buffer are spilled by a background task too, so
+file I/O never runs on the redirect path. Unparseable WAL lines are moved to
+a quarantine file instead of blocking replay.
+
+Every click carries a click_id. Retries and replays within CLICK_DEDUPE_WINDOW
+collapse onto the first click's id in memory, and rows are upserted with
+ignore-duplicates on click_id, so each click is stored exactly once.
+Client-supplied ids must match CLICK_ID_PATTERN (they are stored and echoed in
+the X-Click-Id header); anything else is ignored in favour of the fingerprint id.
+"""
+
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import re
+import threading
+import time
+import uuid
+from collections import OrderedDict, deque
+from datetime import datetime
+from typing import Any, Callable, Deque, Dict, List, Optional, Tuple
+
+from utils.retry import CircuitOpenError, supabase_breaker, supabase_retry
+from utils.supabase_client import supabase, supabase_db, upsert
+
+# ---------------------------
+# Configuration
+# ---------------------------
+CLICKS_TABLE: str = "affiliate_clicks"
+CLICK_BUFFER_MAX: int = int(os.getenv("CLICK_BUFFER_MAX", 10000))
+CLICK_FLUSH_BATCH: int = int(os.getenv("CLICK_FLUSH_BATCH", 200))
+CLICK_FLUSH_INTERVAL: float = float(os.getenv("CLICK_FLUSH_INTERVAL", 2.0))
+CLICK_WAL_FILE: str = os.getenv("CLICK_WAL_FILE", "click_wal.jsonl")
+CLICK_DEDUPE_WINDOW: float = float(os.getenv("CLICK_DEDUPE_WINDOW", 30))
+CLICK_DEDUPE_MAX_KEYS: int = int(os.getenv("CLICK_DEDUPE_MAX_KEYS", 100000))
+CLICK_ID_MAX_LENGTH: int = 128
+CLICK_ID_PATTERN = re.compile(rf"[A-Za-z0-9_-]{{1,{CLICK_ID_MAX_LENGTH}}}")
+
+
+def client_fingerprint(host: Optional[str], forwarded_for: Optional[str], user_agent: Optional[str]) -> str:
+    """Identify the clicking client (first X-Forwarded-For hop behind Render's proxy)."""
+    ip = (forwarded_for or "").split(",")[0].strip() or host or ""
+    return f"{ip}|{user_agent or ''}"
+
+# ---------------------------
+# Pipeline
+# ---------------------------
+class ClickPipeline:
+    """Bounded buffer + batch flusher + write-ahead spill file."""
+
+    def __init__(
+        self,
+        max_buffer: int = CLICK_BUFFER_MAX,
+        batch_size: int = CLICK_FLUSH_BATCH,
+        interval: float = CLICK_FLUSH_INTERVAL,
+        wal_path: str = CLICK_WAL_FILE,
+        client=None,
+    ):
+        self.max_buffer = max_buffer
+        self.batch_size = batch_size
+        self.interval = interval
+        self.wal_path = wal_path
+        self.client = client or supabase
+        self._buffer: Deque[Dict[str, Any]] = deque()
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self._overflow: List[Dict[str, Any]] = []
+        self._spill_task: Optional[asyncio.Task] = None
+        self._wal_lock = threading.Lock()
+        self.counters: Dict[str, int] = {
+            "recorded": 0, "deduplicated": 0, "flushed": 0, "spilled": 0, "replayed": 0, "flush_errors": 0,
+            "circuit_open": 0, "corrupt_lines": 0, "invalid_click_ids": 0,
+        }
+        self.last_flush_ms: Optional[float] = None
+        self._last_flush_ok = True
+        self._recent: "OrderedDict[str, Tuple[float, str]]" = OrderedDict()
+        self._listeners: List[Callable[[Dict[str, Any]], None]] = []
+
+    def subscribe(self, listener: Callable[[Dict[str, Any]], None]) -> None:
+        """Call `listener(event)` for every accepted (non-duplicate) click."""
+        self._listeners.append(listener)
+
+    # ---- producer side (event loop, never blocks on the database) ----
+    def record_click(
+        self,
+        link_id: str,
+        utm_source: str,
+        utm_medium: str,
+        utm_campaign: str,
+        click_id: Optional[str] = None,
+        fingerprint: Optional[str] = None,
+    ) -> Tuple[str, bool]:
+        """
+        Record one click and return (click_id, duplicate). A client-supplied click_id,
+        or else the client fingerprint + link + UTM values, identifies replays.
+        """
+        if click_id and not (isinstance(click_id, str) and CLICK_ID_PATTERN.fullmatch(click_id)):
+            # Never store or echo arbitrary client input (e.g. CR/LF into a response header)
+            self.counters["invalid_click_ids"] += 1
+            click_id = None
+        if click_id:
+            key = f"id:{click_id}"
+        elif fingerprint:
+            raw = f"{fingerprint}|{link_id}|{utm_source}|{utm_medium}|{utm_campaign}"
+            key = "fp:" + hashlib.sha1(raw.encode()).hexdigest()
+        else:
+            key = None
+
+        now = time.monotonic()
+        while self._recent and next(iter(self._recent.values()))[0] <= now:
+            self._recent.popitem(last=False)
+        if key is not None and key in self._recent:
+            self.counters["deduplicated"] += 1
+            return self._recent[key][1], True
+
+        if not click_id:
+            if key is not None:
+                # Deterministic per window, so replays hitting another worker collapse in the DB
+                bucket = int(time.time() // CLICK_DEDUPE_WINDOW)
+                click_id = str(uuid.uuid5(uuid.NAMESPACE_URL, f"{key}|{bucket}"))
+            else:
+                click_id = str(uuid.uuid4())
+        if key is not None:
+            self._recent[key] = (now + CLICK_DEDUPE_WINDOW, click_id)
+            if len(self._recent) > CLICK_DEDUPE_MAX_KEYS:
+                self._recent.popitem(last=False)
+
+        event = {
+            "click_id": click_id,
+            "link_id": link_id,
+            "clicked_at": datetime.utcnow().isoformat(),
+            "utm_source": utm_source,
+            "utm_medium": utm_medium,
+            "utm_campaign": utm_campaign,
+        }
+        self.record(event)
+        for listener in self._listeners:
+            try:
+                listener(event)
+            except Exception as e:
+                logging.error(f"❌ Click listener failed: {e}")
+        return click_id, False
+
+    def record(self, event: Dict[str, Any]) -> None:
+        self.counters["recorded"] += 1
+        if len(self._buffer) >= self.max_buffer:
+            # Buffer full: the flusher is behind, so hand the event to the spill task
+            self._overflow.append(event)
+            if self._spill_task is None or self._spill_task.done():
+                self._spill_task = asyncio.get_event_loop().create_task(self._spill_overflow())
+            return
+        self._buffer.append(event)
+        if self._wakeup is not None and len(self._buffer) >= self.batch_size:
+            self._wakeup.set()
+
+    # ---- lifecycle ----
+    async def start(self) -> None:
+        if self._task is None:
+            self._wakeup = asyncio.Event()
+            self._task = asyncio.get_event_loop().create_task(self._run())
+            logging.info(f"🖱️ Click pipeline started (batch={self.batch_size}, interval={self.interval}s)")
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self._spill_task is not None:
+            await self._spill_task
+        await self._spill_overflow()
+        while self._buffer:
+            await self.flush()
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            try:
+                while self._buffer:
+                    await self.flush()
+                    if len(self._buffer) < self.batch_size:
+                        break
+                if self._last_flush_ok and supabase_breaker.state == "closed":
+                    await self._replay()
+            except Exception as e:
+                logging.error(f"❌ Click pipeline iteration failed: {e}")
+
+    # ---- flushing ----
+    def _insert(self, rows: List[Dict[str, Any]]) -> None:
+        # Rows whose click_id is already stored are skipped server-side
+        upsert(CLICKS_TABLE, rows, on_conflict="click_id", client=self.client, ignore_duplicates=True)
+
+    async def flush(self) -> int:
+        """Write one batch from the buffer; spill it to the WAL on failure."""
+        batch = [self._buffer.popleft() for _ in range(min(self.batch_size, len(self._buffer)))]
+        if not batch:
+            return 0
+        started = time.perf_counter()
+        try:
+            await supabase_retry.call(self._insert, batch)
+        except CircuitOpenError:
+            self._last_flush_ok = False
+            self.counters["circuit_open"] += 1
+            await asyncio.to_thread(self._spill, batch)
+            return 0
+        except Exception as e:
+            self._last_flush_ok = False
+            self.counters["flush_errors"] += 1
+            logging.warning(f"⚠️ Click flush failed, spilling {len(batch)} events to {self.wal_path}: {e}")
+            await asyncio.to_thread(self._spill, batch)
+            return 0
+        self._last_flush_ok = True
+        self.last_flush_ms = (time.perf_counter() - started) * 1000
+        self.counters["flushed"] += len(batch)
+        return len(batch)
+
+    def _write_wal(self, events: List[Dict[str, Any]]) -> None:
+        with self._wal_lock, open(self.wal_path, "a") as f:
+            for event in events:
+                f.write(json.dumps(event, default=str) + "\n")
+
+    def _spill(self, events: List[Dict[str, Any]]) -> None:
+        self._write_wal(events)
+        self.counters["spilled"] += len(events)
+
+    async def _spill_overflow(self) -> None:
+        """Write overflowed clicks to the WAL on a worker thread, off the event loop."""
+        while self._overflow:
+            events, self._overflow = self._overflow, []
+            try:
+                await asyncio.to_thread(self._spill, events)
+            except Exception as e:
+                logging.error(f"❌ Could not spill {len(events)} overflowed click events: {e}")
+
+    async def _replay(self) -> None:
+        pending = os.path.exists(f"{self.wal_path}.replay") or (
+            os.path.exists(self.wal_path) and os.path.getsize(self.wal_path) > 0
+        )
+        if pending:
+            await supabase_db.run(self._replay_sync)
+
+    def _replay_sync(self) -> None:
+        """Re-send spilled events; whatever still fails is written back to the WAL."""
+        replaying = f"{self.wal_path}.replay"
+        with self._wal_lock:
+            if not os.path.exists(replaying):
+                os.replace(self.wal_path, replaying)
+        events, corrupt = [], []
+        with open(replaying) as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                try:
+                    events.append(json.loads(line))
+                except ValueError:
+                    corrupt.append(line if line.endswith("\n") else line + "\n")
+        if corrupt:
+            # Keep them for inspection, but never let them block the rest of the replay
+            with open(f"{self.wal_path}.corrupt", "a") as f:
+                f.writelines(corrupt)
+            self.counters["corrupt_lines"] += len(corrupt)
+            logging.warning(f"⚠️ Quarantined {len(corrupt)} unparseable click WAL lines to {self.wal_path}.corrupt")
+        sent = 0
+        try:
+            for start in range(0, len(events), self.batch_size):
+                supabase_breaker.call(self._insert, events[start:start + self.batch_size])
+                sent = start + self.batch_size
+        except Exception as e:
+            logging.warning(f"⚠️ Click WAL replay stopped after {sent} events: {e}")
+            self._write_wal(events[sent:])
+        sent = min(sent, len(events))
+        self.counters["replayed"] += sent
+        os.remove(replaying)
+        if sent:
+            logging.info(f"📤 Replayed {sent} spilled click events")
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            **self.counters,
+            "buffered": len(self._buffer),
+            "overflow_pending": len(self._overflow),
+            "dedupe_keys": len(self._recent),
+            "buffer_max": self.max_buffer,
+            "wal_bytes": os.path.getsize(self.wal_path) if os.path.exists(self.wal_path) else 0,
+            "last_flush_ms": round(self.last_flush_ms, 2) if self.last_flush_ms is not None else None,
+        }
+
+
+click_pipeline = ClickPipeline()
@@ -0,0 +1,326 @@
+"""
+Streaming click rollups for Blood API
+Clicks are counted per minute in memory, keyed by (link_id, utm_source,
+utm_medium, utm_campaign), as the click pipeline accepts them. A background
+task adds the pending deltas to `click_rollups` through an increment RPC, so
+several workers can share the table. Recent minutes stay in memory for
+millisecond time-range and top-N queries; older ranges read the rollup table.
+
+The in-memory counters only hold this process's clicks since it started, so
+they answer a range only when it starts after this process began counting and
+this process is the table's single writer (CLICK_ROLLUP_SINGLE_WRITER, on by
+default unless WEB_CONCURRENCY > 1). Rows the increment RPC rejects outright
+(4xx) are written to CLICK_ROLLUP_DEAD_LETTER_FILE instead of being retried forever.
+
+Increments are not idempotent, so every flushed batch carries a batch id that
+the RPC applies at most once. A batch whose outcome is unknown (timeout, 5xx,
+open circuit) is resent later under the same id instead of being merged back.
+"""
+
+import asyncio
+import json
+import logging
+import os
+import time
+import uuid
+from collections import defaultdict, deque
+from datetime import datetime, timezone
+from typing import Any, Deque, Dict, Iterable, List, Optional, Tuple
+
+from utils.retry import CircuitOpenError, is_transient_error, supabase_breaker, supabase_retry
+from utils.supabase_client import supabase, supabase_db
+
+# ---------------------------
+# Configuration
+# ---------------------------
+ROLLUPS_TABLE: str = "click_rollups"
+ROLLUPS_INCREMENT_RPC: str = "increment_click_rollups"
+CLICK_ROLLUP_FLUSH_INTERVAL: float = float(os.getenv("CLICK_ROLLUP_FLUSH_INTERVAL", 10.0))
+CLICK_ROLLUP_RETENTION_MINUTES: int = int(os.getenv("CLICK_ROLLUP_RETENTION_MINUTES", 1440))
+CLICK_ROLLUP_SINGLE_WRITER: bool = os.getenv(
+    "CLICK_ROLLUP_SINGLE_WRITER", "true" if int(os.getenv("WEB_CONCURRENCY", 1)) <= 1 else "false",
+).lower() in ("1", "true", "yes")
+CLICK_ROLLUP_DEAD_LETTER_FILE: str = os.getenv("CLICK_ROLLUP_DEAD_LETTER_FILE", "click_rollups_dead.jsonl")
+
+RollupKey = Tuple[str, str, str, str]  # (link_id, utm_source, utm_medium, utm_campaign)
+Batch = Tuple[str, List[Dict[str, Any]]]  # (batch_id, rows)
+GROUP_FIELDS: Dict[str, Tuple[int, ...]] = {
+    "link": (0,),
+    "source": (1,),
+    "medium": (2,),
+    "campaign": (3,),
+    "key": (0, 1, 2, 3),
+}
+KEY_NAMES = ("link_id", "utm_source", "utm_medium", "utm_campaign")
+
+
+def to_minute(value: datetime) -> int:
+    """Minute bucket (epoch minutes) of a datetime; naive values are taken as UTC."""
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return int(value.timestamp() // 60)
+
+
+def minute_iso(minute: int) -> str:
+    return datetime.fromtimestamp(minute * 60, tz=timezone.utc).isoformat()
+
+# ---------------------------
+# Rollups
+# ---------------------------
+class ClickRollups:
+    """Per-minute counters with a retained in-memory window and a delta flusher."""
+
+    def __init__(
+        self,
+        retention_minutes: int = CLICK_ROLLUP_RETENTION_MINUTES,
+        interval: float = CLICK_ROLLUP_FLUSH_INTERVAL,
+        single_writer: bool = CLICK_ROLLUP_SINGLE_WRITER,
+        dead_letter_path: str = CLICK_ROLLUP_DEAD_LETTER_FILE,
+        client=None,
+    ):
+        self.retention_minutes = retention_minutes
+        self.interval = interval
+        self.single_writer = single_writer
+        self.dead_letter_path = dead_letter_path
+        self.client = client or supabase
+        # First minute this process saw in full; earlier clicks only exist in the table
+        self.since = int(time.time() // 60) + 1
+        self._minutes: Dict[int, Dict[RollupKey, int]] = {}
+        self._pending: Dict[Tuple[int, RollupKey], int] = defaultdict(int)
+        # Batches sent without a definite answer, resent in order under the same id
+        self._unacked: Deque[Batch] = deque()
+        self._task: Optional[asyncio.Task] = None
+        self.counters: Dict[str, int] = {
+            "observed": 0, "rejected": 0, "flushed_rows": 0, "flush_errors": 0, "dead_lettered": 0,
+        }
+        self.last_flush_ms: Optional[float] = None
+
+    # ---- ingest (event loop, O(1) per click) ----
+    def observe(self, event: Dict[str, Any]) -> None:
+        """Count one accepted click (registered as a click pipeline listener)."""
+        if not event.get("link_id"):
+            # link_id is part of the table's key (not null); such a row could never be stored
+            self.counters["rejected"] += 1
+            return
+        self.add(
+            (event["link_id"], event["utm_source"] or "", event["utm_medium"] or "", event["utm_campaign"] or ""),
+            int(time.time() // 60),
+        )
+
+    def add(self, key: RollupKey, minute: int, count: int = 1) -> None:
+        bucket = self._minutes.get(minute)
+        if bucket is None:
+            bucket = self._minutes[minute] = defaultdict(int)
+            self._prune(minute)
+        bucket[key] += count
+        self._pending[(minute, key)] += count
+        self.counters["observed"] += count
+
+    def _prune(self, newest: int) -> None:
+        oldest = newest - self.retention_minutes
+        for minute in [m for m in self._minutes if m < oldest]:
+            del self._minutes[minute]
+
+    # ---- lifecycle ----
+    async def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.get_event_loop().create_task(self._run())
+            logging.info(f"📊 Click rollups started (interval={self.interval}s, retention={self.retention_minutes}m)")
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.interval)
+            await self.flush()
+
+    # ---- flushing ----
+    def _increment(self, batch_id: str, rows: List[Dict[str, Any]]) -> None:
+        # The RPC adds to existing counts, so concurrent workers never overwrite each
+        # other; batch_id makes a resent batch a no-op if the first attempt landed
+        self.client.rpc(ROLLUPS_INCREMENT_RPC, {"rows": rows, "batch_id": batch_id}).execute()
+
+    async def flush(self) -> int:
+        """
+        Resend unacknowledged batches, then send pending deltas as a new batch.
+        New deltas wait in memory until older batches are acknowledged; a batch
+        rejected outright is split into rows to dead-letter the bad ones.
+        """
+        flushed = 0
+        while self._unacked:
+            sent = await self._send(*self._unacked[0])
+            if sent is None:
+                return flushed
+            self._unacked.popleft()
+            flushed += sent
+        if not self._pending:
+            return flushed
+        pending, self._pending = self._pending, defaultdict(int)
+        rows = [
+            {"minute": minute_iso(minute), **dict(zip(KEY_NAMES, key)), "clicks": count}
+            for (minute, key), count in pending.items()
+        ]
+        batch = (str(uuid.uuid4()), rows)
+        sent = await self._send(*batch)
+        if sent is None:
+            self._unacked.append(batch)
+            return flushed
+        return flushed + sent
+
+    async def _send(self, batch_id: str, rows: List[Dict[str, Any]]) -> Optional[int]:
+        """Rows flushed, or None when the outcome is unknown and the batch must be resent as is."""
+        started = time.perf_counter()
+        try:
+            # Retrying is safe: the RPC applies each batch_id at most once
+            await supabase_retry.call(self._increment, batch_id, rows)
+        except Exception as e:
+            self.counters["flush_errors"] += 1
+            if isinstance(e, CircuitOpenError) or is_transient_error(e):
+                if not isinstance(e, CircuitOpenError):
+                    logging.warning(f"⚠️ Click rollup flush failed, will resend batch of {len(rows)} rows: {e}")
+                return None
+            logging.warning(f"⚠️ Click rollup batch rejected ({e}); isolating bad rows")
+            return await self._flush_rows(rows)
+        self.last_flush_ms = (time.perf_counter() - started) * 1000
+        self.counters["flushed_rows"] += len(rows)
+        return len(rows)
+
+    async def _flush_rows(self, rows: List[Dict[str, Any]]) -> int:
+        """
+        Send rows one at a time (the rejected batch was rolled back as a whole): rejected
+        ones go to the dead-letter file, ones with an unknown outcome are queued for resend.
+        """
+        dead: List[Dict[str, Any]] = []
+        flushed = 0
+        for row in rows:
+            batch_id = str(uuid.uuid4())
+            try:
+                await supabase_db.run(self._increment, batch_id, [row])
+                flushed += 1
+            except Exception as e:
+                if is_transient_error(e):
+                    self._unacked.append((batch_id, [row]))
+                else:
+                    dead.append({"row": row, "error": str(e), "at": datetime.utcnow().isoformat()})
+        if dead:
+            await asyncio.to_thread(self._write_dead_letters, dead)
+            self.counters["dead_lettered"] += len(dead)
+            logging.error(f"❌ {len(dead)} click rollup rows rejected; written to {self.dead_letter_path}")
+        self.counters["flushed_rows"] += flushed
+        return flushed
+
+    def _write_dead_letters(self, entries: List[Dict[str, Any]]) -> None:
+        with open(self.dead_letter_path, "a") as f:
+            for entry in entries:
+                f.write(json.dumps(entry, default=str) + "\n")
+
+    # ---- queries ----
+    def covers(self, start: int) -> bool:
+        """
+        Whether the in-memory counters hold every click from minute `start`: the range
+        starts after this process began counting, is inside the retention window, and
+        no other worker writes clicks this process never saw.
+        """
+        return (
+            self.single_writer
+            and start >= self.since
+            and start >= int(time.time() // 60) - self.retention_minutes
+        )
+
+    def query(
+        self,
+        start: int,
+        end: int,
+        group_by: str = "link",
+        top: int = 10,
+        link_id: Optional[str] = None,
+    ) -> Dict[str, Any]:
+        """Totals, a per-minute series and the top-N groups for minutes [start, end]."""
+        cells = (
+            (minute, key, count)
+            for minute, bucket in self._minutes.items()
+            if start <= minute <= end
+            for key, count in bucket.items()
+        )
+        return summarize(cells, start, end, group_by, top, link_id)
+
+    def query_table(
+        self,
+        start: int,
+        end: int,
+        group_by: str = "link",
+        top: int = 10,
+        link_id: Optional[str] = None,
+        page_size: int = 1000,
+    ) -> Dict[str, Any]:
+        """Same answer as `query`, read from the rollup table (blocking; run in a thread)."""
+        cells: List[Tuple[int, RollupKey, int]] = []
+        offset = 0
+        while True:
+            builder = (
+                self.client.table(ROLLUPS_TABLE)
+                .select("minute,link_id,utm_source,utm_medium,utm_campaign,clicks")
+                .order("minute,link_id,utm_source,utm_medium,utm_campaign")  # stable offset paging
+                .gte("minute", minute_iso(start))
+                .lte("minute", minute_iso(end))
+            )
+            if link_id:
+                builder = builder.eq("link_id", link_id)
+            page = supabase_breaker.call(builder.range(offset, offset + page_size - 1).execute).data or []
+            for row in page:
+                minute = to_minute(datetime.fromisoformat(row["minute"]))
+                cells.append((minute, tuple(row[name] for name in KEY_NAMES), row["clicks"]))
+            if len(page) < page_size:
+                break
+            offset += page_size
+        return summarize(cells, start, end, group_by, top, link_id)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            **self.counters,
+            "minutes_retained": len(self._minutes),
+            "keys_retained": sum(len(bucket) for bucket in self._minutes.values()),
+            "pending_deltas": len(self._pending),
+            "unacked_batches": len(self._unacked),
+            "single_writer": self.single_writer,
+            "counting_since": minute_iso(self.since),
+            "last_flush_ms": round(self.last_flush_ms, 2) if self.last_flush_ms is not None else None,
+        }
+
+
+def summarize(
+    cells: Iterable[Tuple[int, RollupKey, int]],
+    start: int,
+    end: int,
+    group_by: str,
+    top: int,
+    link_id: Optional[str],
+) -> Dict[str, Any]:
+    fields = GROUP_FIELDS[group_by]
+    groups: Dict[Tuple[str, ...], int] = defaultdict(int)
+    series: Dict[int, int] = defaultdict(int)
+    for minute, key, count in cells:
+        if link_id and key[0] != link_id:
+            continue
+        groups[tuple(key[i] for i in fields)] += count
+        series[minute] += count
+    ranked = sorted(groups.items(), key=lambda item: item[1], reverse=True)[:top]
+    return {
+        "start": minute_iso(start),
+        "end": minute_iso(end),
+        "group_by": group_by,
+        "total": sum(series.values()),
+        "top": [{**{KEY_NAMES[i]: value for i, value in zip(fields, group)}, "clicks": count} for group, count in ranked],
+        "series": [{"minute": minute_iso(minute), "clicks": series[minute]} for minute in sorted(series)],
+    }
+
+
+click_rollups = ClickRollups()
@@ -0,0 +1,306 @@
+"""
+Fair prompt queue for Blood API
+Drop-in replacement for the single FIFO behind /ask. Items are kept per
+priority class and, inside a class, per conversation_id:
+
+  * classes are served by weighted round-robin (ASK_PRIORITY_WEIGHTS), so a
+    busy high class cannot starve the others completely;
+  * conversations inside a class take turns, one item each, so one chat
+    flooding prompts only delays itself;
+  * a conversation with ASK_CONVERSATION_MAX_INFLIGHT items being processed
+    is skipped until one of them finishes.
+
+Per-class wait (enqueue -> dispatch) and total (enqueue -> done) latencies are
+kept as rolling samples for /metrics/ask.
+
+Admission is bounded: puts are rejected with QueueRejected (429 + Retry-After
+at the API) once ASK_QUEUE_MAX_DEPTH items are waiting, or when the expected
+wait for a new item (depth x average service time / workers) would exceed
+ASK_ADMISSION_MAX_WAIT seconds.
+
+Items may carry a `deadline` (time.monotonic()) and the requester's `future`.
+Workers never see an item whose future is already done (requester gone) or
+whose deadline has passed: it is dropped at dispatch time, the future of an
+expired one failing with asyncio.TimeoutError. Producers whose requester
+leaves call discard() so the item stops counting towards depth and admission
+right away.
+"""
+
+import asyncio
+import math
+import os
+import time
+from collections import OrderedDict, deque
+from typing import Any, Deque, Dict, List, Optional
+
+# ---------------------------
+# Configuration
+# ---------------------------
+def parse_weights(raw: str) -> "OrderedDict[str, int]":
+    """"high:4,normal:2,low:1" -> OrderedDict(high=4, normal=2, low=1)."""
+    weights: "OrderedDict[str, int]" = OrderedDict()
+    for part in raw.split(","):
+        name, _, weight = part.strip().partition(":")
+        if name:
+            weights[name] = max(1, int(weight or 1))
+    return weights
+
+
+ASK_PRIORITY_WEIGHTS = parse_weights(os.getenv("ASK_PRIORITY_WEIGHTS", "high:4,normal:2,low:1"))
+ASK_DEFAULT_PRIORITY: str = os.getenv("ASK_DEFAULT_PRIORITY", "normal")
+ASK_CONVERSATION_MAX_INFLIGHT: int = int(os.getenv("ASK_CONVERSATION_MAX_INFLIGHT", 1))
+ASK_LATENCY_SAMPLES: int = int(os.getenv("ASK_LATENCY_SAMPLES", 1024))
+ASK_QUEUE_MAX_DEPTH: int = int(os.getenv("ASK_QUEUE_MAX_DEPTH", 1000))
+ASK_ADMISSION_MAX_WAIT: float = float(os.getenv("ASK_ADMISSION_MAX_WAIT", 30.0))
+# Smoothing factor for the moving average of per-item service time
+SERVICE_TIME_ALPHA: float = 0.2
+
+
+class QueueRejected(Exception):
+    """Raised by put() when the queue sheds load; `retry_after` is a hint in seconds."""
+
+    def __init__(self, reason: str, retry_after: int):
+        super().__init__(f"Queue is {reason}, retry in {retry_after}s")
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+def percentiles(samples, points=(0.5, 0.95, 0.99)) -> Dict[str, Optional[float]]:
+    ordered = sorted(samples)
+    return {
+        f"p{int(q * 100)}_ms": round(ordered[min(len(ordered) - 1, int(q * len(ordered)))] * 1000, 1) if ordered else None
+        for q in points
+    }
+
+# ---------------------------
+# Queue
+# ---------------------------
+class PriorityClass:
+    def __init__(self, name: str, weight: int):
+        self.name = name
+        self.weight = weight
+        # conversation_id -> pending items; dict order is the round-robin ring
+        self.conversations: "OrderedDict[str, Deque[Dict[str, Any]]]" = OrderedDict()
+        self.size = 0
+        self.dispatched = 0
+        self.completed = 0
+        self.wait_samples: Deque[float] = deque(maxlen=ASK_LATENCY_SAMPLES)
+        self.total_samples: Deque[float] = deque(maxlen=ASK_LATENCY_SAMPLES)
+
+
+class FairQueue:
+    """Weighted round-robin over priority classes, round-robin over conversations."""
+
+    def __init__(
+        self,
+        weights: Dict[str, int] = ASK_PRIORITY_WEIGHTS,
+        default_priority: str = ASK_DEFAULT_PRIORITY,
+        max_inflight_per_conversation: int = ASK_CONVERSATION_MAX_INFLIGHT,
+        max_depth: int = ASK_QUEUE_MAX_DEPTH,
+        max_wait: float = ASK_ADMISSION_MAX_WAIT,
+    ):
+        self.classes: Dict[str, PriorityClass] = {name: PriorityClass(name, w) for name, w in weights.items()}
+        if default_priority not in self.classes:
+            raise ValueError(f"Default priority '{default_priority}' is not a configured class")
+        self.default_priority = default_priority
+        self.max_inflight = max(1, max_inflight_per_conversation)
+        # Weighted rotation, e.g. [high, high, high, high, normal, normal, low]
+        self._rotation: List[str] = [name for name, w in weights.items() for _ in range(w)]
+        self._turn = 0
+        self._inflight: Dict[str, int] = {}
+        self._changed = asyncio.Event()
+        self.max_depth = max_depth
+        self.max_wait = max_wait
+        # Workers pulling from this queue (set by the pool), used to estimate wait
+        self.concurrency = 0
+        self.service_time: Optional[float] = None
+        self.rejected: Dict[str, int] = {"full": 0, "overloaded": 0}
+        self.dropped: Dict[str, int] = {"cancelled": 0, "expired": 0}
+
+    def __len__(self) -> int:
+        return sum(c.size for c in self.classes.values())
+
+    def qsize(self) -> int:
+        return len(self)
+
+    # ---- admission ----
+    def expected_wait(self, ahead: Optional[int] = None) -> Optional[float]:
+        """Seconds a new item would wait, or None before any item has completed."""
+        if self.service_time is None:
+            return None
+        ahead = len(self) if ahead is None else ahead
+        return (ahead + 1) * self.service_time / max(1, self.concurrency)
+
+    def admit(self) -> None:
+        if self.max_depth and len(self) >= self.max_depth:
+            self.rejected["full"] += 1
+            raise QueueRejected("full", self._retry_after(len(self) - self.max_depth + 1))
+        expected = self.expected_wait()
+        if self.max_wait and expected is not None and expected > self.max_wait:
+            self.rejected["overloaded"] += 1
+            raise QueueRejected("overloaded", max(1, math.ceil(expected - self.max_wait)))
+
+    def _retry_after(self, excess: int) -> int:
+        # Time for the workers to drain `excess` items, at least a second
+        if self.service_time is None:
+            return 1
+        return max(1, math.ceil(excess * self.service_time / max(1, self.concurrency)))
+
+    # ---- producer side ----
+    def put_nowait(self, item: Dict[str, Any]) -> None:
+        """
+        Queue a dict carrying at least `conversation_id`; `priority` defaults to the
+        default class. Raises QueueRejected when the queue sheds load.
+        """
+        priority = item.setdefault("priority", self.default_priority)
+        cls = self.classes.get(priority)
+        if cls is None:
+            raise ValueError(f"Unknown priority '{priority}' (expected one of: {', '.join(self.classes)})")
+        self.admit()
+        item["enqueued_at"] = time.monotonic()
+        cls.conversations.setdefault(item.get("conversation_id", "default"), deque()).append(item)
+        cls.size += 1
+        self._changed.set()
+
+    async def put(self, item: Dict[str, Any]) -> None:
+        self.put_nowait(item)
+
+    def discard(self, item: Dict[str, Any]) -> bool:
+        """Remove a still-queued item; False if it was already dispatched (or never queued)."""
+        if "dispatched_at" in item:
+            return False
+        cls = self.classes.get(item.get("priority"))
+        conversation_id = item.get("conversation_id", "default")
+        pending = cls.conversations.get(conversation_id) if cls is not None else None
+        if not pending:
+            return False
+        for index, queued in enumerate(pending):
+            if queued is item:
+                del pending[index]
+                break
+        else:
+            return False
+        if not pending:
+            del cls.conversations[conversation_id]
+        cls.size -= 1
+        self.dropped["cancelled"] += 1
+        return True
+
+    # ---- consumer side ----
+    def _drop_if_dead(self, item: Dict[str, Any], now: float) -> bool:
+        """True if nobody is waiting for `item` any more or its deadline has passed."""
+        future = item.get("future")
+        if future is not None and future.done():
+            self.dropped["cancelled"] += 1
+            return True
+        deadline = item.get("deadline")
+        if deadline is not None and deadline <= now:
+            self.dropped["expired"] += 1
+            if future is not None:
+                future.set_exception(asyncio.TimeoutError())
+            return True
+        return False
+
+    def _pop_from(self, cls: PriorityClass) -> Optional[Dict[str, Any]]:
+        now = time.monotonic()
+        for conversation_id in list(cls.conversations):
+            pending = cls.conversations[conversation_id]
+            while pending and self._drop_if_dead(pending[0], now):
+                pending.popleft()
+                cls.size -= 1
+            if not pending:
+                del cls.conversations[conversation_id]
+                continue
+            if self._inflight.get(conversation_id, 0) >= self.max_inflight:
+                continue
+            pending = cls.conversations.pop(conversation_id)
+            item = pending.popleft()
+            if pending:
+                cls.conversations[conversation_id] = pending  # back of the ring
+            cls.size -= 1
+            return item
+        return None
+
+    def get_nowait(self) -> Optional[Dict[str, Any]]:
+        """Next eligible item, or None if everything queued belongs to capped conversations."""
+        for offset in range(len(self._rotation)):
+            name = self._rotation[(self._turn + offset) % len(self._rotation)]
+            cls = self.classes[name]
+            if not cls.size:
+                continue
+            item = self._pop_from(cls)
+            if item is None:
+                continue
+            self._turn = (self._turn + offset + 1) % len(self._rotation)
+            conversation_id = item.get("conversation_id", "default")
+            self._inflight[conversation_id] = self._inflight.get(conversation_id, 0) + 1
+            item["dispatched_at"] = time.monotonic()
+            cls.dispatched += 1
+            cls.wait_samples.append(item["dispatched_at"] - item["enqueued_at"])
+            return item
+        return None
+
+    async def get(self) -> Dict[str, Any]:
+        while True:
+            item = self.get_nowait()
+            if item is not None:
+                return item
+            self._changed.clear()
+            await self._changed.wait()
+
+    async def wait_changed(self, timeout: float) -> None:
+        """Wait up to `timeout` seconds for a put or a freed in-flight slot."""
+        self._changed.clear()
+        try:
+            await asyncio.wait_for(self._changed.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+
+    def task_done(self, item: Dict[str, Any], batch_size: int = 1) -> None:
+        """
+        Release the item's in-flight slot and record its end-to-end latency.
+        Items served together in one batch each count 1/batch_size of its service time.
+        """
+        conversation_id = item.get("conversation_id", "default")
+        remaining = self._inflight.get(conversation_id, 0) - 1
+        if remaining > 0:
+            self._inflight[conversation_id] = remaining
+        else:
+            self._inflight.pop(conversation_id, None)
+        now = time.monotonic()
+        cls = self.classes[item["priority"]]
+        cls.completed += 1
+        cls.total_samples.append(now - item["enqueued_at"])
+        served = (now - item["dispatched_at"]) / max(1, batch_size)
+        self.service_time = served if self.service_time is None else (
+            SERVICE_TIME_ALPHA * served + (1 - SERVICE_TIME_ALPHA) * self.service_time
+        )
+        self._changed.set()
+
+    # ---- metrics ----
+    def stats(self) -> Dict[str, Any]:
+        expected = self.expected_wait()
+        return {
+            "depth": len(self),
+            "max_depth": self.max_depth,
+            "inflight": sum(self._inflight.values()),
+            "workers": self.concurrency,
+            "service_time_ms": round(self.service_time * 1000, 1) if self.service_time is not None else None,
+            "expected_wait_s": round(expected, 2) if expected is not None else None,
+            "max_wait_s": self.max_wait,
+            "rejected": dict(self.rejected),
+            "dropped": dict(self.dropped),
+            "max_inflight_per_conversation": self.max_inflight,
+            "classes": {
+                name: {
+                    "weight": cls.weight,
+                    "queued": cls.size,
+                    "conversations": len(cls.conversations),
+                    "dispatched": cls.dispatched,
+                    "completed": cls.completed,
+                    "wait": percentiles(cls.wait_samples),
+                    "latency": percentiles(cls.total_samples),
+                }
+                for name, cls in self.classes.items()
+            },
+        }
@@ -0,0 +1,113 @@
+"""
+Shared HTTP clients for Blood API
+One long-lived httpx.AsyncClient per upstream (Google CSE, Ollama, Mind agent),
+created at app startup and closed on shutdown, so requests reuse pooled
+keep-alive connections instead of paying a TCP/TLS handshake every call.
+"""
+
+import logging
+import os
+from typing import Any, Dict
+
+import httpx
+
+# ---------------------------
+# Configuration
+# ---------------------------
+HTTP_MAX_CONNECTIONS: int = int(os.getenv("HTTP_POOL_MAX_CONNECTIONS", 20))
+HTTP_MAX_KEEPALIVE: int = int(os.getenv("HTTP_POOL_MAX_KEEPALIVE", 10))
+HTTP_KEEPALIVE_EXPIRY: float = float(os.getenv("HTTP_POOL_KEEPALIVE_EXPIRY", 30.0))
+HTTP2_ENABLED: bool = os.getenv("HTTP2_ENABLED", "false").lower() in ("1", "true", "yes")
+
+# Per-upstream timeouts (seconds)
+UPSTREAM_TIMEOUTS: Dict[str, httpx.Timeout] = {
+    "google_cse": httpx.Timeout(float(os.getenv("GOOGLE_CSE_TIMEOUT", 10.0)), connect=5.0),
+    "ollama": httpx.Timeout(float(os.getenv("OLLAMA_TIMEOUT", 30.0)), connect=5.0),
+    "mind": httpx.Timeout(float(os.getenv("MIND_AGENT_TIMEOUT", 30.0)), connect=5.0),
+}
+
+
+def _http2_available() -> bool:
+    if not HTTP2_ENABLED:
+        return False
+    try:
+        import h2  # noqa: F401
+        return True
+    except ImportError:
+        logging.warning("⚠️ HTTP2_ENABLED is set but the 'h2' package is not installed; using HTTP/1.1")
+        return False
+
+# ---------------------------
+# Client registry
+# ---------------------------
+class HTTPClientPool:
+    """Named AsyncClients with shared pool limits and per-upstream timeouts."""
+
+    def __init__(self, timeouts: Dict[str, httpx.Timeout]):
+        self.timeouts = timeouts
+        self.limits = httpx.Limits(
+            max_connections=HTTP_MAX_CONNECTIONS,
+            max_keepalive_connections=HTTP_MAX_KEEPALIVE,
+            keepalive_expiry=HTTP_KEEPALIVE_EXPIRY,
+        )
+        self._clients: Dict[str, httpx.AsyncClient] = {}
+        self._requests: Dict[str, int] = {}
+
+    async def start(self) -> None:
+        http2 = _http2_available()
+        for name, timeout in self.timeouts.items():
+            if name not in self._clients:
+                self._clients[name] = self._build(name, timeout, http2)
+        logging.info(f"🔌 HTTP clients ready: {', '.join(self._clients)} (http2={http2})")
+
+    def _build(self, name: str, timeout: httpx.Timeout, http2: bool) -> httpx.AsyncClient:
+        self._requests[name] = 0
+
+        async def count_request(request: httpx.Request) -> None:
+            self._requests[name] += 1
+
+        return httpx.AsyncClient(
+            timeout=timeout,
+            limits=self.limits,
+            http2=http2,
+            event_hooks={"request": [count_request]},
+        )
+
+    async def close(self) -> None:
+        for client in self._clients.values():
+            await client.aclose()
+        self._clients.clear()
+        logging.info("🔌 HTTP clients closed")
+
+    def get(self, name: str) -> httpx.AsyncClient:
+        """
+        Return the shared client for an upstream. Outside the app lifecycle
+        (scripts, tests) a client is created on first use.
+        """
+        client = self._clients.get(name)
+        if client is None or client.is_closed:
+            client = self._clients[name] = self._build(name, self.timeouts[name], _http2_available())
+        return client
+
+    def stats(self) -> Dict[str, Any]:
+        """Connection pool usage per upstream, read from the underlying httpcore pools."""
+        stats: Dict[str, Any] = {}
+        for name, client in self._clients.items():
+            pool = getattr(getattr(client, "_transport", None), "_pool", None)
+            connections = list(getattr(pool, "connections", []))
+            idle = sum(1 for c in connections if c.is_idle())
+            pending = [r for r in getattr(pool, "_requests", []) if getattr(r, "connection", None) is None]
+            stats[name] = {
+                "connections": len(connections),
+                "active": len(connections) - idle,
+                "idle": idle,
+                "waiting_requests": len(pending),
+                "max_connections": self.limits.max_connections,
+                "max_keepalive": self.limits.max_keepalive_connections,
+                "saturated": len(connections) - idle >= (self.limits.max_connections or 0) > 0,
+                "requests_total": self._requests.get(name, 0),
+            }
+        return stats
+
+
+http_clients = HTTPClientPool(UPSTREAM_TIMEOUTS)
@@ -0,0 +1,205 @@
+"""
+Leader election for Blood API
+Every uvicorn/gunicorn worker runs the same startup, but scheduled jobs should
+run in exactly one process. Workers race for a lock that the OS or database
+drops automatically when its holder dies:
+
+  * Postgres advisory lock (SCHEDULER_LEADER_DSN set, psycopg2 installed):
+    held by a dedicated session, so it spans hosts.
+  * File lock (default stand-in): flock on SCHEDULER_LEADER_LOCK_FILE, which
+    covers all workers on one host / container.
+
+Followers retry every SCHEDULER_LEADER_RETRY seconds, so leadership fails over
+within one retry interval after the leader exits or crashes.
+"""
+
+import fcntl
+import hashlib
+import logging
+import os
+import threading
+from typing import Any, Callable, Dict, Optional
+
+# ---------------------------
+# Configuration
+# ---------------------------
+SCHEDULER_LEADER_DSN: Optional[str] = os.getenv("SCHEDULER_LEADER_DSN") or None
+SCHEDULER_LEADER_LOCK_FILE: str = os.getenv("SCHEDULER_LEADER_LOCK_FILE", "scheduler.leader.lock")
+SCHEDULER_LEADER_NAME: str = os.getenv("SCHEDULER_LEADER_NAME", "blood-scheduler")
+SCHEDULER_LEADER_RETRY: float = float(os.getenv("SCHEDULER_LEADER_RETRY", 15.0))
+
+# ---------------------------
+# Locks
+# ---------------------------
+class FileLeaderLock:
+    """Non-blocking flock; released by the kernel when the holding process exits."""
+
+    kind = "file"
+
+    def __init__(self, path: str = SCHEDULER_LEADER_LOCK_FILE):
+        self.path = path
+        self._file = None
+
+    def try_acquire(self) -> bool:
+        if self._file is not None:
+            return True
+        f = open(self.path, "a+")
+        try:
+            fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            f.close()
+            return False
+        f.seek(0)
+        f.truncate()
+        f.write(f"{os.getpid()}\n")
+        f.flush()
+        self._file = f
+        return True
+
+    def still_held(self) -> bool:
+        return self._file is not None
+
+    def release(self) -> None:
+        if self._file is not None:
+            fcntl.flock(self._file, fcntl.LOCK_UN)
+            self._file.close()
+            self._file = None
+
+
+class PostgresLeaderLock:
+    """Session-level pg advisory lock; released by Postgres when the session ends."""
+
+    kind = "postgres"
+
+    def __init__(self, dsn: str, name: str = SCHEDULER_LEADER_NAME):
+        import psycopg2  # optional dependency, only needed when SCHEDULER_LEADER_DSN is set
+
+        self._connect = lambda: psycopg2.connect(dsn, connect_timeout=5)
+        # Advisory locks take a bigint key; derive a stable one from the name
+        self.key = int.from_bytes(hashlib.sha1(name.encode()).digest()[:8], "big", signed=True)
+        self._conn = None
+
+    def try_acquire(self) -> bool:
+        if self._conn is None:
+            self._conn = self._connect()
+            self._conn.autocommit = True
+        try:
+            with self._conn.cursor() as cur:
+                cur.execute("select pg_try_advisory_lock(%s)", (self.key,))
+                return bool(cur.fetchone()[0])
+        except Exception:
+            self._close()  # reconnect on the next attempt
+            raise
+
+    def still_held(self) -> bool:
+        # The lock lives exactly as long as this session does
+        try:
+            with self._conn.cursor() as cur:
+                cur.execute("select 1")
+            return True
+        except Exception:
+            self._close()
+            return False
+
+    def release(self) -> None:
+        if self._conn is not None:
+            try:
+                with self._conn.cursor() as cur:
+                    cur.execute("select pg_advisory_unlock(%s)", (self.key,))
+            except Exception:
+                pass
+            self._close()
+
+    def _close(self) -> None:
+        try:
+            self._conn.close()
+        except Exception:
+            pass
+        self._conn = None
+
+
+def default_lock():
+    if SCHEDULER_LEADER_DSN:
+        try:
+            return PostgresLeaderLock(SCHEDULER_LEADER_DSN)
+        except ImportError:
+            logging.warning("⚠️ SCHEDULER_LEADER_DSN is set but psycopg2 is not installed; using a file lock")
+    return FileLeaderLock()
+
+# ---------------------------
+# Elector
+# ---------------------------
+class LeaderElector:
+    """Background thread that holds (or keeps trying for) the lock and fires callbacks on changes."""
+
+    def __init__(self, lock=None, retry_interval: float = SCHEDULER_LEADER_RETRY):
+        self.lock = lock
+        self.retry_interval = retry_interval
+        self.is_leader = False
+        self._on_elected: Callable[[], None] = lambda: None
+        self._on_demoted: Callable[[], None] = lambda: None
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.counters: Dict[str, int] = {"elected": 0, "demoted": 0, "errors": 0}
+
+    def start(self, on_elected: Callable[[], None], on_demoted: Callable[[], None]) -> None:
+        if self._thread is not None:
+            return
+        self.lock = self.lock or default_lock()
+        self._on_elected, self._on_demoted = on_elected, on_demoted
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="leader-elector", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        if self._thread is None:
+            return
+        self._stop.set()
+        self._thread.join(timeout=10)
+        self._thread = None
+        if self.is_leader:
+            self._demote("shutting down")
+        self.lock.release()
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            try:
+                if self.is_leader:
+                    if not self.lock.still_held():
+                        self._demote("lock lost")
+                elif self.lock.try_acquire():
+                    self.is_leader = True
+                    self.counters["elected"] += 1
+                    logging.info(f"👑 PID {os.getpid()} is the scheduler leader ({self.lock.kind} lock)")
+                    try:
+                        self._on_elected()
+                    except Exception:
+                        # Let another worker take over rather than hold a lock with no jobs running
+                        self.is_leader = False
+                        self.lock.release()
+                        raise
+            except Exception as e:
+                self.counters["errors"] += 1
+                logging.warning(f"⚠️ Leader election check failed: {e}")
+            self._stop.wait(self.retry_interval)
+
+    def _demote(self, reason: str) -> None:
+        self.is_leader = False
+        self.counters["demoted"] += 1
+        logging.warning(f"👋 PID {os.getpid()} gave up scheduler leadership ({reason})")
+        try:
+            self._on_demoted()
+        except Exception as e:
+            logging.error(f"❌ Demotion callback failed: {e}")
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "pid": os.getpid(),
+            "is_leader": self.is_leader,
+            "lock": self.lock.kind if self.lock else None,
+            "retry_interval": self.retry_interval,
+            **self.counters,
+        }
+
+
+scheduler_leader = LeaderElector()
@@ -0,0 +1,63 @@
+"""
+Redirect fast path for Blood API
+Plain ASGI middleware that answers GET /r/{link_id} before FastAPI's router,
+dependency resolution and response classes get involved. Everything else is
+passed through untouched. The FastAPI route with the same path stays
+registered for the OpenAPI docs and as the fallback.
+"""
+
+from typing import Awaitable, Callable, Optional, Tuple
+from urllib.parse import parse_qsl, quote
+
+from utils.click_pipeline import client_fingerprint
+
+# resolve(link_id, source, medium, campaign, click_id, fingerprint, record=...) -> (target URL, click_id).
+# HEAD requests (link unfurlers, crawlers) are resolved with record=False and get no click id.
+Resolver = Callable[..., Awaitable[Tuple[str, Optional[str]]]]
+
+LOCATION_SAFE = ":/%#?=@[]!$&'()*+,;"
+
+
+class RedirectFastPath:
+    def __init__(self, app, resolve: Resolver, prefix: str = "/r/", defaults: dict = None):
+        self.app = app
+        self.resolve = resolve
+        self.prefix = prefix
+        self.defaults = defaults or {"source": "autoloop", "medium": "affiliate", "campaign": "default"}
+
+    async def __call__(self, scope, receive, send):
+        path = scope.get("path", "")
+        if (
+            scope["type"] != "http"
+            or scope["method"] not in ("GET", "HEAD")
+            or not path.startswith(self.prefix)
+            or "/" in path[len(self.prefix):]
+            or len(path) == len(self.prefix)
+        ):
+            await self.app(scope, receive, send)
+            return
+
+        params = dict(self.defaults)
+        if scope.get("query_string"):
+            params.update(parse_qsl(scope["query_string"].decode("latin-1")))
+        headers = dict(scope.get("headers") or [])
+        fingerprint = client_fingerprint(
+            (scope.get("client") or ("", 0))[0],
+            headers.get(b"x-forwarded-for", b"").decode("latin-1"),
+            headers.get(b"user-agent", b"").decode("latin-1"),
+        )
+        click_id = params.get("click_id") or headers.get(b"idempotency-key", b"").decode("latin-1") or None
+        target, click_id = await self.resolve(
+            path[len(self.prefix):], params["source"], params["medium"], params["campaign"], click_id, fingerprint,
+            record=scope["method"] == "GET",
+        )
+        try:
+            location = target.encode("latin-1")
+        except UnicodeEncodeError:
+            location = quote(target, safe=LOCATION_SAFE).encode("latin-1")
+
+        response_headers = [(b"location", location), (b"cache-control", b"no-store"), (b"content-length", b"0")]
+        if click_id is not None:
+            response_headers.append((b"x-click-id", click_id.encode("latin-1", "replace")))
+        await send({"type": "http.response.start", "status": 302, "headers": response_headers})
+        await send({"type": "http.response.body", "body": b""})
@@ -0,0 +1,264 @@
+"""
+Async retry engine for Blood API
+Exponential backoff with full jitter, a retry budget that caps retries to a
+fraction of normal traffic, and a circuit breaker so callers fail fast while
+an upstream (Supabase) is down instead of piling up sleeping requests.
+
+Only transient errors (no response, timeouts, 5xx, 429) are retried or count
+against the breaker. A 4xx such as a constraint violation fails at once:
+retrying cannot fix the request and the upstream is evidently healthy.
+"""
+
+import asyncio
+import logging
+import os
+import random
+import threading
+import time
+from concurrent.futures import Executor
+from typing import Any, Awaitable, Callable, Dict, Optional, TypeVar
+
+import httpx
+
+from utils.supabase_client import supabase_db
+
+T = TypeVar("T")
+
+# ---------------------------
+# Configuration
+# ---------------------------
+SUPABASE_RETRY_ATTEMPTS: int = int(os.getenv("SUPABASE_RETRY_ATTEMPTS", 3))
+SUPABASE_RETRY_BASE_DELAY: float = float(os.getenv("SUPABASE_RETRY_BASE_DELAY", 0.2))
+SUPABASE_RETRY_MAX_DELAY: float = float(os.getenv("SUPABASE_RETRY_MAX_DELAY", 2.0))
+SUPABASE_RETRY_BUDGET_RATIO: float = float(os.getenv("SUPABASE_RETRY_BUDGET_RATIO", 0.2))
+SUPABASE_BREAKER_THRESHOLD: int = int(os.getenv("SUPABASE_BREAKER_THRESHOLD", 5))
+SUPABASE_BREAKER_RESET: float = float(os.getenv("SUPABASE_BREAKER_RESET", 30.0))
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling an upstream whose circuit is open."""
+
+
+def is_transient_error(error: BaseException) -> bool:
+    """
+    True for errors worth retrying: transport failures and HTTP 5xx / 429. The
+    status comes from the error's `status_code` (set by supabase_db.call) or, on
+    the thread that made the request, from the Supabase transport.
+    """
+    if isinstance(error, (httpx.TransportError, ConnectionError, TimeoutError)):
+        return True
+    status = getattr(error, "status_code", None)
+    if status is None:
+        status = supabase_db.last_status()
+    return status is not None and (status == 429 or status >= 500)
+
+# ---------------------------
+# Retry budget
+# ---------------------------
+class RetryBudget:
+    """
+    Each first attempt deposits `ratio` tokens; each retry withdraws one.
+    `min_per_sec` tokens trickle in so low-traffic callers can still retry.
+    """
+
+    def __init__(self, ratio: float = 0.2, min_per_sec: float = 1.0, cap: float = 100.0):
+        self.ratio = ratio
+        self.min_per_sec = min_per_sec
+        self.cap = cap
+        self._tokens = cap
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self._tokens = min(self.cap, self._tokens + (now - self._updated) * self.min_per_sec)
+        self._updated = now
+
+    def deposit(self) -> None:
+        with self._lock:
+            self._refill()
+            self._tokens = min(self.cap, self._tokens + self.ratio)
+
+    def withdraw(self) -> bool:
+        with self._lock:
+            self._refill()
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return True
+            return False
+
+    @property
+    def tokens(self) -> float:
+        with self._lock:
+            self._refill()
+            return self._tokens
+
+# ---------------------------
+# Circuit breaker
+# ---------------------------
+class CircuitBreaker:
+    """
+    closed -> open after `threshold` consecutive failures; open -> half_open after
+    `reset_timeout`; one probe in half_open closes it again or reopens it.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        threshold: int = 5,
+        reset_timeout: float = 30.0,
+        is_failure: Callable[[BaseException], bool] = lambda e: True,
+    ):
+        self.name = name
+        self.is_failure = is_failure
+        self.threshold = threshold
+        self.reset_timeout = reset_timeout
+        self.state = "closed"
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probing = False
+        self._probe_started = 0.0
+        self._lock = threading.Lock()
+        self.counters: Dict[str, int] = {"rejected": 0, "opened": 0}
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self.state == "open" and time.monotonic() - self._opened_at >= self.reset_timeout:
+                self.state, self._probing = "half_open", False
+            if self.state == "closed":
+                return True
+            # A probe that never reported back (e.g. cancelled) is given up after reset_timeout
+            stale_probe = self._probing and time.monotonic() - self._probe_started >= self.reset_timeout
+            if self.state == "half_open" and (not self._probing or stale_probe):
+                self._probing, self._probe_started = True, time.monotonic()
+                return True
+            self.counters["rejected"] += 1
+            return False
+
+    def record_success(self) -> None:
+        with self._lock:
+            if self.state != "closed":
+                logging.info(f"✅ Circuit '{self.name}' closed")
+            self.state, self._failures, self._probing = "closed", 0, False
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self._failures += 1
+            if self.state == "half_open" or self._failures >= self.threshold:
+                if self.state != "open":
+                    self.counters["opened"] += 1
+                    logging.warning(f"⚡ Circuit '{self.name}' opened after {self._failures} failures")
+                self.state, self._opened_at, self._probing = "open", time.monotonic(), False
+
+    def call(self, fn: Callable[..., T], *args, **kwargs) -> T:
+        """Synchronous guarded call (for code already running in a worker thread)."""
+        if not self.allow():
+            raise CircuitOpenError(f"{self.name} circuit is open")
+        try:
+            result = fn(*args, **kwargs)
+        except Exception as e:
+            if self.is_failure(e):
+                self.record_failure()
+            else:
+                self.record_success()  # the upstream answered; the request itself was bad
+            raise
+        self.record_success()
+        return result
+
+    def stats(self) -> Dict[str, Any]:
+        return {"state": self.state, "consecutive_failures": self._failures, **self.counters}
+
+# ---------------------------
+# Retry policy
+# ---------------------------
+class RetryPolicy:
+    """Async retries with full-jitter exponential backoff, a budget and a breaker."""
+
+    def __init__(
+        self,
+        max_attempts: int = 3,
+        base_delay: float = 0.2,
+        max_delay: float = 2.0,
+        budget: Optional[RetryBudget] = None,
+        breaker: Optional[CircuitBreaker] = None,
+        is_transient: Callable[[BaseException], bool] = lambda e: True,
+        executor: Optional[Executor] = None,
+    ):
+        self.max_attempts = max(1, max_attempts)
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.budget = budget
+        self.breaker = breaker
+        self.is_transient = is_transient
+        self.executor = executor
+        self.counters: Dict[str, int] = {"calls": 0, "retries": 0, "budget_exhausted": 0, "failures": 0, "non_retryable": 0}
+
+    def backoff(self, attempt: int) -> float:
+        return random.uniform(0, min(self.max_delay, self.base_delay * (2 ** attempt)))
+
+    async def run(self, fn: Callable[[], Awaitable[T]]) -> T:
+        """Await fn() until it succeeds, attempts run out, the budget is spent or the circuit opens."""
+        self.counters["calls"] += 1
+        if self.budget:
+            self.budget.deposit()
+        for attempt in range(self.max_attempts):
+            if self.breaker and not self.breaker.allow():
+                raise CircuitOpenError(f"{self.breaker.name} circuit is open")
+            try:
+                result = await fn()
+            except Exception as e:
+                if not self.is_transient(e):
+                    if self.breaker:
+                        self.breaker.record_success()  # the upstream answered; the request itself was bad
+                    self.counters["non_retryable"] += 1
+                    self.counters["failures"] += 1
+                    raise
+                if self.breaker:
+                    self.breaker.record_failure()
+                if attempt == self.max_attempts - 1:
+                    self.counters["failures"] += 1
+                    raise
+                if self.budget and not self.budget.withdraw():
+                    self.counters["budget_exhausted"] += 1
+                    self.counters["failures"] += 1
+                    raise
+                delay = self.backoff(attempt)
+                self.counters["retries"] += 1
+                logging.warning(f"🔁 Attempt {attempt + 1}/{self.max_attempts} failed ({e}); retrying in {delay:.2f}s")
+                await asyncio.sleep(delay)
+            else:
+                if self.breaker:
+                    self.breaker.record_success()
+                return result
+        raise RuntimeError("unreachable")
+
+    async def call(self, fn: Callable[..., T], *args, **kwargs) -> T:
+        """Run a blocking function in a worker thread (or `executor`) under this policy."""
+        if self.executor is None:
+            return await self.run(lambda: asyncio.to_thread(fn, *args, **kwargs))
+        loop = asyncio.get_running_loop()
+        # supabase_db.call tags failures with their HTTP status for is_transient
+        return await self.run(lambda: loop.run_in_executor(self.executor, lambda: supabase_db.call(fn, *args, **kwargs)))
+
+    def stats(self) -> Dict[str, Any]:
+        stats: Dict[str, Any] = dict(self.counters)
+        if self.budget:
+            stats["budget_tokens"] = round(self.budget.tokens, 2)
+        if self.breaker:
+            stats["breaker"] = self.breaker.stats()
+        return stats
+
+
+supabase_breaker = CircuitBreaker(
+    "supabase", threshold=SUPABASE_BREAKER_THRESHOLD, reset_timeout=SUPABASE_BREAKER_RESET,
+    is_failure=is_transient_error,
+)
+supabase_retry = RetryPolicy(
+    max_attempts=SUPABASE_RETRY_ATTEMPTS,
+    base_delay=SUPABASE_RETRY_BASE_DELAY,
+    max_delay=SUPABASE_RETRY_MAX_DELAY,
+    budget=RetryBudget(ratio=SUPABASE_RETRY_BUDGET_RATIO),
+    breaker=supabase_breaker,
+    is_transient=is_transient_error,
+    executor=supabase_db.executor,
+)
@@ -0,0 +1,183 @@
+"""
+Google Custom Search cache for Blood API
+LRU + TTL cache keyed on the normalized query, with request coalescing for
+identical in-flight queries and a local daily quota counter. When the quota
+runs out, stale entries are served instead of failing.
+"""
+
+import asyncio
+import logging
+import os
+import time
+from collections import OrderedDict
+from datetime import datetime
+from typing import Any, Awaitable, Callable, Dict, Tuple
+from zoneinfo import ZoneInfo
+
+# ---------------------------
+# Configuration
+# ---------------------------
+SEARCH_CACHE_MAX_ENTRIES: int = int(os.getenv("SEARCH_CACHE_MAX_ENTRIES", 512))
+SEARCH_CACHE_TTL: float = float(os.getenv("SEARCH_CACHE_TTL", 3600))
+# How long expired entries are kept around as a fallback once the quota is spent
+SEARCH_CACHE_STALE_TTL: float = float(os.getenv("SEARCH_CACHE_STALE_TTL", 7 * 86400))
+# CSE free tier is 100 queries/day; the budget resets at midnight Pacific time
+GOOGLE_CSE_DAILY_QUOTA: int = int(os.getenv("GOOGLE_CSE_DAILY_QUOTA", 100))
+QUOTA_TIMEZONE = ZoneInfo("America/Los_Angeles")
+
+
+class QuotaExhausted(Exception):
+    """Raised when the daily CSE budget is spent and no stale entry exists."""
+
+
+def normalize_query(query: str) -> str:
+    return " ".join(query.lower().split())
+
+# ---------------------------
+# Quota
+# ---------------------------
+class QuotaCounter:
+    """Counts upstream calls per Pacific-time day against a fixed budget."""
+
+    def __init__(self, daily_limit: int):
+        self.daily_limit = daily_limit
+        self._day = self._today()
+        self.used = 0
+
+    @staticmethod
+    def _today() -> str:
+        return datetime.now(QUOTA_TIMEZONE).date().isoformat()
+
+    def _roll(self) -> None:
+        today = self._today()
+        if today != self._day:
+            self._day, self.used = today, 0
+
+    def try_consume(self) -> bool:
+        self._roll()
+        if self.daily_limit and self.used >= self.daily_limit:
+            return False
+        self.used += 1
+        return True
+
+    def exhaust(self) -> None:
+        """Upstream says we are out of quota; stop spending until the next reset."""
+        self._roll()
+        self.used = max(self.used, self.daily_limit)
+
+    @property
+    def remaining(self) -> int:
+        self._roll()
+        return max(0, self.daily_limit - self.used)
+
+# ---------------------------
+# Cache
+# ---------------------------
+class SearchCache:
+    """LRU/TTL cache with single-flight fetches per normalized query."""
+
+    def __init__(
+        self,
+        max_entries: int = SEARCH_CACHE_MAX_ENTRIES,
+        ttl: float = SEARCH_CACHE_TTL,
+        stale_ttl: float = SEARCH_CACHE_STALE_TTL,
+        daily_quota: int = GOOGLE_CSE_DAILY_QUOTA,
+    ):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.quota = QuotaCounter(daily_quota)
+        self._entries: "OrderedDict[str, Tuple[float, Any]]" = OrderedDict()
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self.counters: Dict[str, int] = {"hit": 0, "miss": 0, "coalesced": 0, "stale": 0, "quota_rejected": 0}
+
+    def _lookup(self, key: str) -> Tuple[Any, float]:
+        """Return (value, age) or (None, inf); drops entries past the stale window."""
+        entry = self._entries.get(key)
+        if entry is None:
+            return None, float("inf")
+        age = time.monotonic() - entry[0]
+        if age > self.stale_ttl:
+            del self._entries[key]
+            return None, float("inf")
+        self._entries.move_to_end(key)
+        return entry[1], age
+
+    def _store(self, key: str, value: Any) -> None:
+        self._entries[key] = (time.monotonic(), value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    async def get_or_fetch(self, query: str, fetch: Callable[[], Awaitable[Any]]) -> Tuple[Any, str]:
+        """
+        Return (value, status) where status is hit, miss, coalesced or stale.
+        `fetch` must raise on upstream failure; failures are not cached.
+        """
+        key = normalize_query(query)
+        value, age = self._lookup(key)
+        if value is not None and age <= self.ttl:
+            self.counters["hit"] += 1
+            return value, "hit"
+
+        inflight = self._inflight.get(key)
+        if inflight is not None:
+            self.counters["coalesced"] += 1
+            try:
+                return await asyncio.shield(inflight), "coalesced"
+            except asyncio.CancelledError:
+                if not inflight.cancelled():
+                    raise  # this request itself was cancelled
+                # The leading request went away mid-fetch; take over the lookup
+                return await self.get_or_fetch(query, fetch)
+
+        if not self.quota.try_consume():
+            return self._stale_or_raise(key, value)
+
+        future = asyncio.get_event_loop().create_future()
+        self._inflight[key] = future
+        try:
+            result = await fetch()
+        except Exception as e:
+            future.set_exception(e)
+            future.exception()  # mark retrieved when nobody else is waiting
+            raise
+        else:
+            self._store(key, result)
+            future.set_result(result)
+            self.counters["miss"] += 1
+            return result, "miss"
+        finally:
+            # Cancellation (client gone) skips the except above; never leave followers waiting
+            if not future.done():
+                future.cancel()
+            self._inflight.pop(key, None)
+
+    def _stale_or_raise(self, key: str, value: Any) -> Tuple[Any, str]:
+        if value is not None:
+            self.counters["stale"] += 1
+            logging.info(f"♻️ CSE quota spent, serving stale results for '{key}'")
+            return value, "stale"
+        self.counters["quota_rejected"] += 1
+        raise QuotaExhausted("Google CSE daily quota exhausted")
+
+    def serve_stale(self, query: str) -> Tuple[Any, str]:
+        """Fallback after the upstream itself reports quota exhaustion (HTTP 429)."""
+        self.quota.exhaust()
+        key = normalize_query(query)
+        return self._stale_or_raise(key, self._lookup(key)[0])
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.counters["hit"] + self.counters["miss"] + self.counters["coalesced"] + self.counters["stale"]
+        return {
+            **self.counters,
+            "hit_ratio": round((lookups - self.counters["miss"]) / lookups, 3) if lookups else None,
+            "entries": len(self._entries),
+            "inflight": len(self._inflight),
+            "quota_used": self.quota.used,
+            "quota_remaining": self.quota.remaining,
+            "quota_daily_limit": self.quota.daily_limit,
+        }
+
+
+search_cache = SearchCache()
@@ -0,0 +1,171 @@
+"""
+Append-only segmented JSONL store for Blood API
+Backs /api/update and /api/results. Each record is one JSON line appended to
+the active segment; segments rotate by size. Every segment has a sidecar index
+of fixed-width byte offsets, so a cursor (the record's global sequence number)
+maps to a file position without scanning.
+
+Layout:
+    <dir>/<base:012d>.jsonl   records, base = sequence number of the first record
+    <dir>/<base:012d>.idx     little-endian uint64 byte offset per record
+    <dir>/.lock               flock'd by writers (safe across workers/processes)
+"""
+
+import fcntl
+import json
+import logging
+import os
+import struct
+import threading
+from bisect import bisect_right
+from typing import Any, Iterator, List, Optional, Tuple
+
+# ---------------------------
+# Configuration
+# ---------------------------
+RESULTS_STORE_DIR: str = os.getenv("RESULTS_STORE_DIR", "results_store")
+SEGMENT_MAX_BYTES: int = int(os.getenv("RESULTS_SEGMENT_MAX_BYTES", 8 * 1024 * 1024))
+RESULTS_FSYNC: bool = os.getenv("RESULTS_FSYNC", "false").lower() in ("1", "true", "yes")
+
+OFFSET = struct.Struct("<Q")
+
+# ---------------------------
+# Segment store
+# ---------------------------
+class SegmentStore:
+    """Append-only JSONL segments with offset indexes and cursor reads."""
+
+    def __init__(self, directory: str = RESULTS_STORE_DIR, max_segment_bytes: int = SEGMENT_MAX_BYTES):
+        self.directory = directory
+        self.max_segment_bytes = max_segment_bytes
+        self._lock = threading.Lock()
+
+    # ---- layout helpers ----
+    def _path(self, base: int, ext: str) -> str:
+        return os.path.join(self.directory, f"{base:012d}.{ext}")
+
+    def _bases(self) -> List[int]:
+        if not os.path.isdir(self.directory):
+            return []
+        return sorted(int(name[:-4]) for name in os.listdir(self.directory) if name.endswith(".idx"))
+
+    def _count(self, base: int) -> int:
+        try:
+            return os.path.getsize(self._path(base, "idx")) // OFFSET.size
+        except FileNotFoundError:
+            return 0
+
+    def __len__(self) -> int:
+        bases = self._bases()
+        return bases[-1] + self._count(bases[-1]) if bases else 0
+
+    # ---- writes ----
+    def append(self, item: Any) -> int:
+        """Append one record and return its sequence number (usable as a cursor)."""
+        line = (json.dumps(item, separators=(",", ":"), default=str) + "\n").encode()
+        os.makedirs(self.directory, exist_ok=True)
+        with self._lock, open(os.path.join(self.directory, ".lock"), "a") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                bases = self._bases()
+                base = bases[-1] if bases else 0
+                count = self._count(base) if bases else 0
+                data_path = self._path(base, "jsonl")
+                if bases and os.path.exists(data_path) and os.path.getsize(data_path) >= self.max_segment_bytes:
+                    base, count = base + count, 0
+                    data_path = self._path(base, "jsonl")
+                    logging.info(f"🗂️ Rotated results store to segment {base:012d}")
+
+                with open(data_path, "ab") as data, open(self._path(base, "idx"), "ab") as index:
+                    offset = data.tell()
+                    data.write(line)
+                    data.flush()
+                    if RESULTS_FSYNC:
+                        os.fsync(data.fileno())
+                    # The index entry is the commit point: readers only see indexed records
+                    index.write(OFFSET.pack(offset))
+                    index.flush()
+                return base + count
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    # ---- reads ----
+    def iter_from(self, cursor: int = 0) -> Iterator[Tuple[int, Any]]:
+        """Yield (sequence, record) from `cursor` onward, one segment at a time."""
+        bases = self._bases()
+        if not bases:
+            return
+        i = max(0, bisect_right(bases, cursor) - 1)
+        for base in bases[i:]:
+            count = self._count(base)
+            position = max(0, cursor - base)
+            if position >= count:
+                continue
+            with open(self._path(base, "idx"), "rb") as index:
+                index.seek(position * OFFSET.size)
+                offsets = [o for (o,) in OFFSET.iter_unpack(index.read((count - position) * OFFSET.size))]
+            with open(self._path(base, "jsonl"), "rb") as data:
+                for seq, offset in enumerate(offsets, base + position):
+                    # Seek only when a torn, unindexed write left a gap
+                    if data.tell() != offset:
+                        data.seek(offset)
+                    yield seq, json.loads(data.readline())
+
+    def page(self, cursor: int = 0, limit: int = 100) -> Tuple[List[Any], Optional[int]]:
+        """Return up to `limit` records from `cursor` and the next cursor (None at the end)."""
+        items: List[Any] = []
+        for seq, record in self.iter_from(cursor):
+            if len(items) >= limit:
+                return items, seq
+            items.append(record)
+        return items, None
+
+    # ---- migration ----
+    def import_legacy(self, path: str) -> int:
+        """
+        One-off import of the old single-file JSON array; renames it afterwards.
+        The file is claimed as <path>.migrating first. A claim left behind by a
+        crashed import is resumed on the next startup, and undecodable content is
+        moved to <path>.corrupt instead of failing startup.
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        with open(os.path.join(self.directory, ".migrate.lock"), "a") as lock_file:
+            try:
+                # Only one worker process imports; the others start without waiting
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                return 0
+            try:
+                return self._import_claimed(path)
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _import_claimed(self, path: str) -> int:
+        claimed = f"{path}.migrating"
+        resuming = os.path.exists(claimed)
+        if not resuming:
+            if len(self):
+                return 0
+            try:
+                os.replace(path, claimed)
+            except FileNotFoundError:
+                return 0
+        try:
+            with open(claimed) as f:
+                items = json.load(f)
+            if not isinstance(items, list):
+                raise ValueError(f"expected a JSON array, got {type(items).__name__}")
+        except ValueError as e:  # includes JSONDecodeError and UnicodeDecodeError
+            os.replace(claimed, f"{path}.corrupt")
+            logging.error(f"❌ Could not import {path} ({e}); moved it to {path}.corrupt")
+            return 0
+        # Imports start on an empty store, so records already stored came from this file
+        done = min(len(self), len(items)) if resuming else 0
+        for item in items[done:]:
+            self.append(item)
+        os.replace(claimed, f"{path}.migrated")
+        resumed = f" (resumed after {done})" if resuming else ""
+        logging.info(f"📥 Imported {len(items) - done} records from {path} into {self.directory}{resumed}")
+        return len(items) - done
+
+results_store = SegmentStore()
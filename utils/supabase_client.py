@@ -1,7 +1,208 @@
-from supabase import create_client
+"""
+Supabase access layer for Blood API
+The client is created on first use (not at import time) with a bounded,
+keep-alive connection pool and a sane timeout. Blocking postgrest calls run
+on a dedicated, bounded thread pool via `supabase_db.run` / `supabase_db.execute`
+so async routes never block the event loop, and every request is timed per
+table (or RPC) at the transport level. The transport also remembers each
+thread's last response status, so callers can tell a 4xx (bad request, never
+worth retrying) from a 5xx/429 even though postgrest's APIError drops it.
+"""
+
+import asyncio
+import logging
 import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Deque, Dict, Optional, TypeVar
+
+import httpx
 
+T = TypeVar("T")
+
+# ---------------------------
+# Configuration
+# ---------------------------
 SUPABASE_URL = os.getenv("SUPABASE_URL")
 SUPABASE_KEY = os.getenv("SUPABASE_KEY")
+SUPABASE_EXECUTOR_WORKERS: int = int(os.getenv("SUPABASE_EXECUTOR_WORKERS", 8))
+SUPABASE_POOL_MAX_CONNECTIONS: int = int(os.getenv("SUPABASE_POOL_MAX_CONNECTIONS", SUPABASE_EXECUTOR_WORKERS * 2))
+SUPABASE_POOL_MAX_KEEPALIVE: int = int(os.getenv("SUPABASE_POOL_MAX_KEEPALIVE", SUPABASE_EXECUTOR_WORKERS))
+SUPABASE_POOL_KEEPALIVE_EXPIRY: float = float(os.getenv("SUPABASE_POOL_KEEPALIVE_EXPIRY", 60.0))
+SUPABASE_TIMEOUT: float = float(os.getenv("SUPABASE_TIMEOUT", 10.0))
+SUPABASE_LATENCY_SAMPLES: int = int(os.getenv("SUPABASE_LATENCY_SAMPLES", 512))
+
+# ---------------------------
+# Instrumentation
+# ---------------------------
+class TableLatency:
+    """Request count, errors and a rolling latency sample for one table or RPC."""
+
+    def __init__(self, samples: int = SUPABASE_LATENCY_SAMPLES):
+        self.requests = 0
+        self.errors = 0
+        self.samples: Deque[float] = deque(maxlen=samples)
+
+    def stats(self) -> Dict[str, Any]:
+        ordered = sorted(self.samples)
+
+        def pct(q: float) -> Optional[float]:
+            return round(ordered[min(len(ordered) - 1, int(q * len(ordered)))], 2) if ordered else None
+
+        return {
+            "requests": self.requests,
+            "errors": self.errors,
+            "p50_ms": pct(0.50),
+            "p95_ms": pct(0.95),
+            "max_ms": round(ordered[-1], 2) if ordered else None,
+        }
+
+
+class InstrumentedTransport(httpx.HTTPTransport):
+    """Pooled transport that times each PostgREST request by table (`/rest/v1/<table>`)."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.tables: Dict[str, TableLatency] = {}
+        self._lock = threading.Lock()
+        self._last = threading.local()
+
+    def last_status(self) -> Optional[int]:
+        """HTTP status of this thread's latest request (None if it got no response)."""
+        return getattr(self._last, "status", None)
+
+    @staticmethod
+    def table_of(path: str) -> str:
+        parts = path.split("/rest/v1/", 1)[-1].strip("/").split("/")
+        return f"rpc:{parts[1]}" if parts[0] == "rpc" and len(parts) > 1 else parts[0] or "-"
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        started = time.perf_counter()
+        failed = True
+        self._last.status = None
+        try:
+            response = super().handle_request(request)
+            self._last.status = response.status_code
+            failed = response.status_code >= 500
+            return response
+        finally:
+            elapsed = (time.perf_counter() - started) * 1000
+            name = self.table_of(request.url.path)
+            with self._lock:
+                latency = self.tables.setdefault(name, TableLatency())
+                latency.requests += 1
+                latency.errors += failed
+                latency.samples.append(elapsed)
+
+# ---------------------------
+# Access layer
+# ---------------------------
+class SupabaseAccess:
+    """Lazily created Supabase client plus a bounded executor for its blocking calls."""
+
+    def __init__(self, url: Optional[str] = SUPABASE_URL, key: Optional[str] = SUPABASE_KEY):
+        self.url = url
+        self.key = key
+        self._client = None
+        self._transport: Optional[InstrumentedTransport] = None
+        self._lock = threading.Lock()
+        self.executor = ThreadPoolExecutor(max_workers=SUPABASE_EXECUTOR_WORKERS, thread_name_prefix="supabase")
+
+    @property
+    def client(self):
+        if self._client is None:
+            with self._lock:
+                if self._client is None:
+                    self._client = self._create()
+        return self._client
+
+    def _create(self):
+        from postgrest.utils import SyncClient
+        from supabase import create_client
+
+        client = create_client(self.url, self.key)
+        # Swap postgrest's default session (no pool limits, 120s timeout) for a tuned one
+        default = client.postgrest.session
+        self._transport = InstrumentedTransport(
+            limits=httpx.Limits(
+                max_connections=SUPABASE_POOL_MAX_CONNECTIONS,
+                max_keepalive_connections=SUPABASE_POOL_MAX_KEEPALIVE,
+                keepalive_expiry=SUPABASE_POOL_KEEPALIVE_EXPIRY,
+            ),
+        )
+        client.postgrest.session = SyncClient(
+            base_url=default.base_url,
+            headers=default.headers,
+            timeout=httpx.Timeout(SUPABASE_TIMEOUT, connect=5.0),
+            transport=self._transport,
+        )
+        default.close()
+        logging.info(f"🗄️ Supabase client created (pool={SUPABASE_POOL_MAX_CONNECTIONS}, workers={SUPABASE_EXECUTOR_WORKERS})")
+        return client
+
+    def last_status(self) -> Optional[int]:
+        return self._transport.last_status() if self._transport is not None else None
+
+    def call(self, fn: Callable[..., T], *args, **kwargs) -> T:
+        """
+        Run a blocking Supabase call on this thread. A failure carries the HTTP
+        status of the request that failed as `status_code` (None without a response).
+        """
+        try:
+            return fn(*args, **kwargs)
+        except Exception as e:
+            if getattr(e, "status_code", None) is None:
+                e.status_code = self.last_status()
+            raise
+
+    async def run(self, fn: Callable[..., T], *args, **kwargs) -> T:
+        """Run a blocking Supabase call on the dedicated executor."""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, lambda: self.call(fn, *args, **kwargs))
+
+    async def execute(self, builder) -> Any:
+        """Await a postgrest request builder, e.g. `await supabase_db.execute(supabase.table(...).select(...))`."""
+        return await self.run(builder.execute)
+
+    def close(self) -> None:
+        if self._client is not None:
+            self._client.postgrest.session.close()
+        self.executor.shutdown(wait=False)
+
+    def stats(self) -> Dict[str, Any]:
+        tables = {}
+        if self._transport is not None:
+            with self._transport._lock:
+                tables = {name: latency.stats() for name, latency in sorted(self._transport.tables.items())}
+        return {
+            "initialized": self._client is not None,
+            "executor_workers": SUPABASE_EXECUTOR_WORKERS,
+            "executor_queued": self.executor._work_queue.qsize(),
+            "tables": tables,
+        }
+
+
+class LazySupabase:
+    """Stand-in for the old module-level client: forwards to the client on first attribute access."""
+
+    def __init__(self, access: SupabaseAccess):
+        self._access = access
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self._access.client, name)
+
+
+supabase_db = SupabaseAccess()
+supabase = LazySupabase(supabase_db)
+
 
-supabase = create_client(SUPABASE_URL, SUPABASE_KEY)
+def upsert(table: str, rows, on_conflict: str, client=None, **kwargs):
+    """
+    Upsert rows with an explicit conflict target. postgrest-py 0.10.3 (pinned by
+    supabase 1.0.0) has no on_conflict argument, so the query param is set directly.
+    """
+    builder = (client or supabase).table(table).upsert(rows, **kwargs)
+    builder.params = builder.params.add("on_conflict", on_conflict)
+    return builder.execute()
@@ -0,0 +1,40 @@
+"""
+UTM URL templates for Blood API
+Each affiliate URL is split once into a prefix (scheme/host/path/existing query)
+and its fragment; rendered (url, source, medium, campaign) combinations are
+memoized, so a redirect is a dictionary lookup instead of string building.
+Values are percent-encoded, and UTM params go before any #fragment.
+"""
+
+import os
+from functools import lru_cache
+from typing import Tuple
+from urllib.parse import quote, urlsplit
+
+UTM_TEMPLATE_CACHE_SIZE: int = int(os.getenv("UTM_TEMPLATE_CACHE_SIZE", 4096))
+UTM_RENDER_CACHE_SIZE: int = int(os.getenv("UTM_RENDER_CACHE_SIZE", 65536))
+
+
+@lru_cache(maxsize=UTM_TEMPLATE_CACHE_SIZE)
+def utm_template(url: str) -> Tuple[str, str]:
+    """Split a URL into (prefix ending in '?' or '&', '#fragment' or '')."""
+    parts = urlsplit(url)
+    fragment = f"#{parts.fragment}" if parts.fragment else ""
+    base = url[: len(url) - len(fragment)] if fragment else url
+    if not parts.query:
+        separator = "" if base.endswith("?") else "?"
+    else:
+        separator = "" if base.endswith("&") else "&"
+    return f"{base}{separator}", fragment
+
+
+@lru_cache(maxsize=UTM_RENDER_CACHE_SIZE)
+def build_utm_url(url: str, source: str, medium: str, campaign: str) -> str:
+    """Return `url` tagged with encoded utm_source/utm_medium/utm_campaign."""
+    prefix, fragment = utm_template(url)
+    return (
+        f"{prefix}utm_source={quote(source, safe='')}"
+        f"&utm_medium={quote(medium, safe='')}"
+        f"&utm_campaign={quote(campaign, safe='')}{fragment}"
+    )
+
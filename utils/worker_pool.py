@@ -0,0 +1,243 @@
+"""
+Autoscaling worker pool for the /ask queue
+Replaces the fixed BLOOD_NUM_WORKERS tasks. A controller runs every
+ASK_AUTOSCALE_INTERVAL seconds and resizes the pool between ASK_MIN_WORKERS and
+ASK_MAX_WORKERS:
+
+  * grow when the queue's expected wait exceeds ASK_AUTOSCALE_TARGET_WAIT,
+    sized to drain the backlog within that target;
+  * hold when upstream latency is above ASK_AUTOSCALE_MAX_LATENCY_MS or the
+    error rate is above ASK_AUTOSCALE_MAX_ERROR_RATE, and shed one worker per
+    tick while errors stay high (more concurrency would only add load to a
+    struggling Mind agent);
+  * shrink by one after ASK_AUTOSCALE_IDLE_TICKS consecutive ticks with an
+    empty queue and at most half the workers busy.
+
+Idle workers (waiting for an item) are cancelled directly; busy ones finish
+their current item first. Every resize is logged and kept for /metrics/ask.
+"""
+
+import asyncio
+import logging
+import math
+import os
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, Optional, Set
+
+# ---------------------------
+# Configuration
+# ---------------------------
+ASK_MIN_WORKERS: int = int(os.getenv("ASK_MIN_WORKERS", os.getenv("BLOOD_NUM_WORKERS", 2)))
+ASK_MAX_WORKERS: int = int(os.getenv("ASK_MAX_WORKERS", 16))
+ASK_AUTOSCALE: bool = os.getenv("ASK_AUTOSCALE", "true").lower() in ("1", "true", "yes")
+ASK_AUTOSCALE_INTERVAL: float = float(os.getenv("ASK_AUTOSCALE_INTERVAL", 5.0))
+ASK_AUTOSCALE_TARGET_WAIT: float = float(os.getenv("ASK_AUTOSCALE_TARGET_WAIT", 2.0))
+ASK_AUTOSCALE_MAX_LATENCY_MS: float = float(os.getenv("ASK_AUTOSCALE_MAX_LATENCY_MS", 20000))
+ASK_AUTOSCALE_MAX_ERROR_RATE: float = float(os.getenv("ASK_AUTOSCALE_MAX_ERROR_RATE", 0.2))
+ASK_AUTOSCALE_IDLE_TICKS: int = int(os.getenv("ASK_AUTOSCALE_IDLE_TICKS", 6))
+# Smoothing factor for the upstream latency moving average
+LATENCY_ALPHA: float = 0.3
+
+# ---------------------------
+# Pool
+# ---------------------------
+class WorkerPool:
+    """Resizable set of tasks that each pull one item from `queue` and pass it to `handle`."""
+
+    def __init__(
+        self,
+        queue,
+        handle: Callable[[Dict[str, Any]], Awaitable[None]],
+        min_workers: int = ASK_MIN_WORKERS,
+        max_workers: int = ASK_MAX_WORKERS,
+    ):
+        self.queue = queue
+        self.handle = handle
+        self.min_workers = max(1, min_workers)
+        self.max_workers = max(self.min_workers, max_workers)
+        self._tasks: Set[asyncio.Task] = set()
+        self._idle: Set[asyncio.Task] = set()
+        self._retire = 0
+        self._spawned = 0
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        # Upstream signals for the controller, reported by `handle` via observe()
+        self.latency: Optional[float] = None
+        self._window = {"calls": 0, "errors": 0}
+
+    @property
+    def size(self) -> int:
+        return len(self._tasks) - self._retire
+
+    @property
+    def busy(self) -> int:
+        return len(self._tasks) - len(self._idle)
+
+    def observe(self, seconds: float, ok: bool) -> None:
+        """Record one upstream call's latency and outcome."""
+        self.latency = seconds if self.latency is None else LATENCY_ALPHA * seconds + (1 - LATENCY_ALPHA) * self.latency
+        self._window["calls"] += 1
+        self._window["errors"] += 0 if ok else 1
+
+    def take_error_rate(self) -> Optional[float]:
+        """Error rate since the last call (None if there were no calls), then reset the window."""
+        calls, errors = self._window["calls"], self._window["errors"]
+        self._window = {"calls": 0, "errors": 0}
+        return errors / calls if calls else None
+
+    def resize(self, target: int) -> int:
+        target = min(self.max_workers, max(self.min_workers, target))
+        while self.size < target:
+            if self._retire:
+                self._retire -= 1  # un-retire a busy worker instead of spawning
+                continue
+            self._spawned += 1
+            task = (self.loop or asyncio.get_event_loop()).create_task(self._run(f"worker-{self._spawned}"))
+            self._tasks.add(task)
+        excess = self.size - target
+        for task in list(self._idle)[:excess]:
+            self._idle.discard(task)
+            self._tasks.discard(task)
+            task.cancel()  # waiting in queue.get(): nothing has been taken yet
+            excess -= 1
+        self._retire += max(0, excess)
+        self.queue.concurrency = self.size
+        return self.size
+
+    async def _run(self, name: str) -> None:
+        task = asyncio.current_task()
+        try:
+            while True:
+                self._idle.add(task)
+                item = await self.queue.get()
+                self._idle.discard(task)
+                await self.handle(item)
+                if self._retire > 0:
+                    self._retire -= 1
+                    return
+        finally:
+            self._idle.discard(task)
+            self._tasks.discard(task)
+            self.queue.concurrency = self.size
+
+    async def stop(self) -> None:
+        for task in list(self._tasks):
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks.clear()
+        self._idle.clear()
+        self._retire = 0
+        self.queue.concurrency = 0
+
+# ---------------------------
+# Controller
+# ---------------------------
+class Autoscaler:
+    """Periodic controller that sizes a WorkerPool from queue depth, latency and errors."""
+
+    def __init__(
+        self,
+        pool: WorkerPool,
+        interval: float = ASK_AUTOSCALE_INTERVAL,
+        target_wait: float = ASK_AUTOSCALE_TARGET_WAIT,
+        max_latency_ms: float = ASK_AUTOSCALE_MAX_LATENCY_MS,
+        max_error_rate: float = ASK_AUTOSCALE_MAX_ERROR_RATE,
+        idle_ticks: int = ASK_AUTOSCALE_IDLE_TICKS,
+    ):
+        self.pool = pool
+        self.interval = interval
+        self.target_wait = target_wait
+        self.max_latency = max_latency_ms / 1000
+        self.max_error_rate = max_error_rate
+        self.idle_ticks = idle_ticks
+        self._idle_streak = 0
+        self._task: Optional[asyncio.Task] = None
+        self.last_error_rate: Optional[float] = None
+        self.decisions: Deque[Dict[str, Any]] = deque(maxlen=50)
+        self.counters: Dict[str, int] = {"ticks": 0, "scale_ups": 0, "scale_downs": 0}
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.get_event_loop().create_task(self._run())
+            logging.info(
+                f"📐 /ask autoscaler started ({self.pool.min_workers}-{self.pool.max_workers} workers, "
+                f"every {self.interval}s)"
+            )
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                self.tick()
+            except Exception as e:
+                logging.error(f"❌ Autoscaler tick failed: {e}")
+
+    def decide(self, depth: int, size: int, busy: int, service_time: Optional[float],
+               latency: Optional[float], error_rate: Optional[float]):
+        """Return (target size, reason) for one tick."""
+        if error_rate is not None and error_rate > self.max_error_rate:
+            self._idle_streak = 0
+            return size - 1, f"error rate {error_rate:.0%} above {self.max_error_rate:.0%}"
+        if depth and service_time:
+            expected = (depth + 1) * service_time / max(1, size)
+            if expected > self.target_wait:
+                self._idle_streak = 0
+                if latency is not None and latency > self.max_latency:
+                    return size, f"backlog but upstream latency {latency * 1000:.0f}ms is above the cap"
+                needed = math.ceil((depth + busy) * service_time / self.target_wait)
+                return max(size + 1, needed), f"expected wait {expected:.1f}s above {self.target_wait:.1f}s"
+        if depth == 0 and busy <= size // 2:
+            self._idle_streak += 1
+            if self._idle_streak >= self.idle_ticks:
+                self._idle_streak = 0
+                return size - 1, f"idle for {self.idle_ticks} ticks"
+        else:
+            self._idle_streak = 0
+        return size, None
+
+    def tick(self) -> None:
+        self.counters["ticks"] += 1
+        pool, queue = self.pool, self.pool.queue
+        size, depth, busy = pool.size, len(queue), pool.busy
+        self.last_error_rate = pool.take_error_rate()
+        target, reason = self.decide(depth, size, busy, queue.service_time, pool.latency, self.last_error_rate)
+        if reason is None:
+            return
+        new_size = pool.resize(target)
+        if new_size == size:
+            return
+        self.counters["scale_ups" if new_size > size else "scale_downs"] += 1
+        decision = {
+            "at": time.time(),
+            "from": size,
+            "to": new_size,
+            "reason": reason,
+            "depth": depth,
+            "busy": busy,
+            "latency_ms": round(pool.latency * 1000, 1) if pool.latency is not None else None,
+            "error_rate": round(self.last_error_rate, 3) if self.last_error_rate is not None else None,
+        }
+        self.decisions.append(decision)
+        logging.info(f"📐 /ask workers {size} -> {new_size}: {reason} (depth={depth}, busy={busy})")
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "enabled": self._task is not None,
+            "workers": self.pool.size,
+            "busy": self.pool.busy,
+            "min_workers": self.pool.min_workers,
+            "max_workers": self.pool.max_workers,
+            "upstream_latency_ms": round(self.pool.latency * 1000, 1) if self.pool.latency is not None else None,
+            "error_rate": self.last_error_rate,
+            **self.counters,
+            "decisions": list(self.decisions)[-10:],
+        }